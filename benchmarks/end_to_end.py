@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""End-to-end throughput of source polling, conversion and target writes.
+
+Runs against :class:`benchmarks.fake_liveblog.FakeLiveblog` and reports posts/sec,
+p50/p99 latency and peak memory (tracemalloc) for every stage.
+
+    python benchmarks/end_to_end.py [--posts 200] [--images 1] [--latency 0.005]
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from livebridge_liveblog import LiveblogLiveblogConverter, LiveblogSource, LiveblogTarget
+from benchmarks.fake_liveblog import FakeLiveblog
+
+SOURCE_ID = "5e0c7a1bf1c2b4a9d0e1f2a3"
+TARGET_ID = "5e0c7a1bf1c2b4a9d0e1f2b4"
+
+
+class Stage(object):
+    """Collects latencies and counted posts of one benchmark stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.timings = []
+        self.posts = 0
+        self.duration = 0
+        self.peak_memory = 0
+        self.errors = 0
+
+    async def run(self, coro, posts=1):
+        """Awaits **coro**, failures are counted and return None like livebridge would retry them."""
+        start = time.perf_counter()
+        try:
+            res = await coro
+        except Exception:
+            self.errors += 1
+            return None
+        elapsed = time.perf_counter() - start
+        self.timings.append(elapsed)
+        self.duration += elapsed
+        self.posts += posts
+        return res
+
+    def percentile(self, pct):
+        timings = sorted(self.timings) or [0]
+        return timings[min(len(timings) - 1, int(len(timings) * pct / 100))] * 1000
+
+    def report(self):
+        rate = self.posts / self.duration if self.duration else 0
+        return "{:<8} {:>6} posts {:>4} errors {:>9.1f} posts/s  p50 {:>8.2f}ms  p99 {:>8.2f}ms  " \
+               "peak {:>8.1f}KiB".format(self.name, self.posts, self.errors, rate, self.percentile(50),
+                                         self.percentile(99), self.peak_memory / 1024)
+
+
+def measure_memory(stage):
+    _, stage.peak_memory = tracemalloc.get_traced_memory()
+    # restart tracing to get the peak of the next stage only
+    tracemalloc.stop()
+    tracemalloc.start()
+
+
+async def run(*, posts, images, texts, latency, error_rate, projection=False, stream=False, page_size=20, tape=None):
+    fake = FakeLiveblog(latency=latency, error_rate=error_rate, seed=1)
+    endpoint = await fake.start()
+    start = datetime.utcnow().replace(microsecond=0) - timedelta(seconds=posts + 60)
+    fake.add_posts(SOURCE_ID, posts, images=images, texts=texts, start=start)
+
+    # record all requests of source and target
+    tape_conf = {"tape_path": tape, "tape_mode": "record"} if tape else {}
+    source = LiveblogSource(config={**tape_conf, "endpoint": endpoint, "source_id": SOURCE_ID, "label": "bench",
+                                    "projection": projection, "stream_posts": stream, "page_size": page_size,
+                                    "max_posts_per_poll": max(posts, page_size)})
+    source.last_updated = start - timedelta(seconds=1)
+    converter = LiveblogLiveblogConverter()
+    target = LiveblogTarget(config={**tape_conf, "endpoint": endpoint, "target_id": TARGET_ID, "label": "bench",
+                                    "auth": {"user": "bench", "password": "bench"}})
+    stages = [Stage("poll"), Stage("convert"), Stage("create"), Stage("update")]
+    polled, images_paths = [], []
+    poll_bytes = 0
+    tracemalloc.start()
+    try:
+        # poll until the backlog is drained
+        while True:
+            res = await stages[0].run(source.poll(), 0)
+            poll_bytes += source.last_poll_bytes
+            if res is None:
+                continue
+            elif not res:
+                break
+            stages[0].posts += len(res)
+            polled.extend(res)
+        measure_memory(stages[0])
+
+        for post in polled:
+            conversion = await stages[1].run(converter.convert(post.data))
+            if conversion is None:
+                continue
+            post.content = conversion.content
+            post.images = conversion.images
+            images_paths.extend(conversion.images)
+        measure_memory(stages[1])
+
+        converted = [post for post in polled if post.content]
+        for post in converted:
+            post.target_doc = await stages[2].run(target.post_item(post))
+        measure_memory(stages[2])
+
+        for post in converted:
+            if post.target_doc is None:
+                continue
+            post.content[0]["text"] += " (corrected)"
+            post.target_doc = await stages[3].run(target.update_item(post)) or post.target_doc
+        measure_memory(stages[3])
+    finally:
+        tracemalloc.stop()
+        await converter.remove_images(images_paths)
+        converter._cache.clear()
+        await source.stop()
+        await target.stop()
+        await fake.stop()
+
+    for stage in stages:
+        print(stage.report())
+    print("polled: {:.1f} KiB, {:.0f} bytes per post".format(poll_bytes / 1024, poll_bytes / max(1, len(polled))))
+    print("requests: " + ", ".join("{} {}".format(k, v) for k, v in sorted(fake.requests.items())))
+    return stages
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=200)
+    parser.add_argument("--images", type=int, default=1, help="image items per post")
+    parser.add_argument("--texts", type=int, default=3, help="text items per post")
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds per request of the fake")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of failing requests")
+    parser.add_argument("--projection", action="store_true", help="request only processed fields of posts")
+    parser.add_argument("--stream", action="store_true", help="parse posts while pages are received")
+    parser.add_argument("--page-size", type=int, default=20, help="posts per requested page")
+    parser.add_argument("--tape", help="record requests to this tape file, for benchmarks/replay.py")
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(run(
+        posts=args.posts, images=args.images, texts=args.texts,
+        latency=args.latency, error_rate=args.error_rate, projection=args.projection,
+        stream=args.stream, page_size=args.page_size, tape=args.tape))
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Local fake of the Liveblog API for benchmarks and integration tests.
+
+Serves ``/auth``, ``client_blogs/<id>``, ``client_blogs/<id>/posts``, ``/items``,
+``/archive`` and ``/posts`` below ``/api``, plus the image files at ``/media``.
+Posts are generated from ``tests/post_to_convert.json``."""
+import asyncio
+import base64
+import copy
+import hashlib
+import json
+import os.path
+import random
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from urllib.parse import unquote
+from aiohttp import web
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "..", "tests")
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S+00:00"
+
+
+def _load_fixture(name, mode="r"):
+    with open(os.path.join(FIXTURES, name), mode) as f:
+        return f.read()
+
+
+def _project(doc, fields):
+    """Returns **doc** with only the dotted **fields**, like Elasticsearch *_source* includes."""
+    tree = {}
+    for field in fields:
+        node = tree
+        for key in field.split("."):
+            node = node.setdefault(key, {})
+
+    def apply(value, node):
+        if not node:
+            return value
+        if isinstance(value, list):
+            return [apply(v, node) for v in value]
+        if isinstance(value, dict):
+            return {k: apply(value[k], sub) for k, sub in node.items() if k in value}
+        return value
+    return apply(doc, tree)
+
+
+class FakeLiveblog(object):
+    """Fake Liveblog instance.
+
+    :param latency: seconds every request is delayed
+    :param error_rate: share of requests answered with **error_status**, between 0 and 1
+    :param error_status: HTTP status of injected errors
+    :param seed: seed for error injection"""
+
+    def __init__(self, *, latency=0.0, error_rate=0.0, error_status=503, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.blogs = {}
+        self.items = {}
+        self.archive = {}
+        self.posts = {}
+        self.tokens = set()
+        self.requests = Counter()
+        self.base_url = None
+        self.endpoint = None
+        self._random = random.Random(seed)
+        self._template = json.loads(_load_fixture("post_to_convert.json"))
+        self._image = _load_fixture("test.jpg", "rb")
+        self._runner = None
+
+        self.app = web.Application(middlewares=[self._middleware])
+        self.app.router.add_post("/api/auth", self.auth)
+        self.app.router.add_get("/api/client_blogs/{blog_id}", self.blog)
+        self.app.router.add_get("/api/client_blogs/{blog_id}/posts", self.blog_posts)
+        self.app.router.add_post("/api/items", self.create_item)
+        self.app.router.add_post("/api/archive", self.create_archive)
+        self.app.router.add_post("/api/posts", self.create_post)
+        self.app.router.add_patch("/api/posts/{post_id}", self.update_post)
+        self.app.router.add_get("/media/{name}", self.media)
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Starts the server, returns the API endpoint."""
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = "http://{}:{}".format(host, port)
+        self.endpoint = "{}/api".format(self.base_url)
+        return self.endpoint
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    # data setup
+
+    def add_blog(self, blog_id, *, status="open"):
+        self.blogs[blog_id] = {"_id": blog_id, "blog_status": status, "title": "Blog {}".format(blog_id)}
+        self.blogs[blog_id]["posts"] = []
+        return self.blogs[blog_id]
+
+    def add_posts(self, blog_id, count, *, images=1, texts=3, start=None, tags=None):
+        """Generates **count** posts in blog **blog_id**, one second apart, starting at **start**.
+
+        Has to be called after :func:`start`, image links point to the running server."""
+        blog = self.blogs.get(blog_id) or self.add_blog(blog_id)
+        start = start or datetime.utcnow().replace(microsecond=0)
+        posts = [self._make_post(blog_id, start + timedelta(seconds=num), images, texts, tags)
+                 for num in range(count)]
+        blog["posts"].extend(posts)
+        return posts
+
+    def edit_post(self, blog_id, post_id, text, *, updated=None):
+        """Changes the first text item of a post and moves its update timestamp."""
+        post = next(p for p in self.blogs[blog_id]["posts"] if p["_id"] == post_id)
+        ref = next(r for r in post["groups"][1]["refs"] if r["item"]["item_type"] == "text")
+        ref["item"]["text"] = text
+        ref["item"]["_etag"] = uuid.uuid4().hex
+        post["_updated"] = (updated or datetime.utcnow()).strftime(TIMESTAMP_FORMAT)
+        post["_etag"] = uuid.uuid4().hex
+        return post
+
+    def _make_post(self, blog_id, created, images, texts, tags):
+        template = self._template["groups"][1]["refs"]
+        text_ref = next(r for r in template if r["item"]["item_type"] == "text")
+        image_ref = next(r for r in template if r["item"]["item_type"] == "image")
+        timestamp = created.strftime(TIMESTAMP_FORMAT)
+        # alternate text and image items
+        item_refs = []
+        for num in range(max(texts, images)):
+            item_refs += [text_ref] if num < texts else []
+            item_refs += [image_ref] if num < images else []
+        refs = []
+        for num, ref in enumerate(item_refs):
+            ref = copy.deepcopy(ref)
+            guid = "urn:fake:item:{}".format(uuid.uuid4().hex)
+            ref["guid"] = ref["residRef"] = guid
+            ref["item"].update({"_id": guid, "guid": guid, "_etag": uuid.uuid4().hex,
+                                "_created": timestamp, "_updated": timestamp, "blog": blog_id})
+            if ref["item"]["item_type"] == "image":
+                for rendition in ref["item"]["meta"]["media"]["renditions"].values():
+                    rendition["href"] = "{}/media/{}.jpg".format(self.base_url, rendition["media"])
+            else:
+                ref["item"]["text"] = "{} {}".format(ref["item"]["text"], num)
+            refs.append(ref)
+        post = copy.deepcopy({k: v for k, v in self._template.items() if k != "groups"})
+        post_id = "urn:fake:post:{}".format(uuid.uuid4().hex)
+        post.update({"_id": post_id, "guid": post_id, "_etag": uuid.uuid4().hex, "blog": blog_id,
+                     "_created": timestamp, "_updated": timestamp, "published_date": timestamp,
+                     "tags": tags or [],
+                     "groups": [copy.deepcopy(self._template["groups"][0]),
+                                {"id": "main", "refs": refs, "role": "grpRole:Main"}]})
+        return post
+
+    # request handling
+
+    @web.middleware
+    async def _middleware(self, request, handler):
+        resource = request.match_info.route.resource
+        self.requests["{} {}".format(request.method, resource.canonical if resource else request.path)] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.error_rate and self._random.random() < self.error_rate:
+            return web.json_response({"_status": "ERR"}, status=self.error_status)
+        return await handler(request)
+
+    def _is_authorized(self, request):
+        header = request.headers.get("Authorization", "")
+        if not header.startswith("Basic "):
+            return False
+        token = base64.b64decode(header[6:]).decode("utf-8").rstrip(":")
+        return token in self.tokens
+
+    def _unauthorized(self):
+        return web.json_response({"_status": "ERR", "_error": {"code": 401}}, status=401)
+
+    async def auth(self, request):
+        data = await request.json()
+        if not data.get("username") or not data.get("password"):
+            return self._unauthorized()
+        token = uuid.uuid4().hex
+        self.tokens.add(token)
+        return web.json_response({"token": token, "user": data["username"]}, status=201)
+
+    async def blog(self, request):
+        blog = self.blogs.get(request.match_info["blog_id"])
+        if not blog:
+            return web.json_response({"_status": "ERR"}, status=404)
+        body = json.dumps({k: v for k, v in blog.items() if k != "posts"}).encode("utf-8")
+        etag = hashlib.sha1(body).hexdigest()
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(body=body, content_type="application/json", headers={"ETag": etag})
+
+    async def blog_posts(self, request):
+        blog = self.blogs.get(request.match_info["blog_id"])
+        if not blog:
+            return web.json_response({"_status": "ERR"}, status=404)
+        page = int(request.query.get("page", 1))
+        max_results = int(request.query.get("max_results", 25))
+        source = request.query.get("source", "{}")
+        # tolerate clients quoting the already encoded query a second time
+        while source.startswith("%"):
+            source = unquote(source)
+        source = json.loads(source)
+        posts = blog["posts"]
+        try:
+            updated = source["query"]["filtered"]["filter"]["and"][0]["range"]["_updated"]
+            if "gt" in updated:
+                posts = [p for p in posts if p["_updated"] > updated["gt"]]
+            if "gte" in updated:
+                posts = [p for p in posts if p["_updated"] >= updated["gte"]]
+        except (KeyError, IndexError):
+            pass
+        tags = source.get("post_filter", {}).get("terms", {}).get("tags")
+        if tags:
+            posts = [p for p in posts if set(p.get("tags", [])) & set(tags)]
+        posts = sorted(posts, key=lambda p: p["_updated"])
+        items = posts[(page - 1) * max_results:page * max_results]
+        includes = source.get("_source", {}).get("includes")
+        if includes:
+            items = [_project(item, includes) for item in items]
+        return web.json_response({
+            "_items": items,
+            "_meta": {"page": page, "max_results": max_results, "total": len(posts)},
+        })
+
+    async def create_item(self, request):
+        if not self._is_authorized(request):
+            return self._unauthorized()
+        item = await request.json()
+        guid = "urn:fake:item:{}".format(uuid.uuid4().hex)
+        item.update({"_id": guid, "guid": guid, "_etag": uuid.uuid4().hex})
+        self.items[guid] = item
+        return web.json_response(item, status=201)
+
+    async def create_archive(self, request):
+        if not self._is_authorized(request):
+            return self._unauthorized()
+        reader = await request.multipart()
+        media = await reader.next()
+        size = len(await media.read())
+        media_id = "urn:fake:media:{}".format(uuid.uuid4().hex)
+        renditions = {}
+        for name, width in [("original", 500), ("baseImage", 1620), ("viewImage", 1080), ("thumbnail", 480)]:
+            renditions[name] = {"href": "{}/media/{}-{}.jpg".format(self.base_url, media_id, name),
+                                "media": "{}-{}".format(media_id, name), "mimetype": "image/jpeg",
+                                "width": width, "height": width // 3 * 2}
+        resource = {"_id": media_id, "size": size, "renditions": renditions}
+        self.archive[media_id] = resource
+        return web.json_response(resource, status=201)
+
+    async def create_post(self, request):
+        if not self._is_authorized(request):
+            return self._unauthorized()
+        post = await request.json()
+        post_id = "urn:fake:post:{}".format(uuid.uuid4().hex)
+        now = datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT)
+        post.update({"_id": post_id, "guid": post_id, "_etag": uuid.uuid4().hex, "_created": now, "_updated": now})
+        self.posts[post_id] = post
+        return web.json_response(post, status=201)
+
+    async def update_post(self, request):
+        if not self._is_authorized(request):
+            return self._unauthorized()
+        post = self.posts.get(request.match_info["post_id"])
+        if not post:
+            return web.json_response({"_status": "ERR"}, status=404)
+        if request.headers.get("If-Match") not in (None, post["_etag"]):
+            return web.json_response({"_status": "ERR", "_error": {"code": 412}}, status=412)
+        post.update(await request.json())
+        post["_etag"] = uuid.uuid4().hex
+        post["_updated"] = datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT)
+        return web.json_response({k: post[k] for k in ("_id", "_etag", "_updated")})
+
+    async def media(self, request):
+        return web.Response(body=self._image, content_type="image/jpeg")
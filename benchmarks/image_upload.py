@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Per-image latency of uploads to ``/archive``.
+
+Compares a fresh ``ClientSession`` per image (the former behaviour of
+``LiveblogTarget._save_image``) with the pooled session of the client.
+
+    python benchmarks/image_upload.py [--count 200]
+"""
+import aiohttp
+import argparse
+import asyncio
+import os.path
+import statistics
+import time
+from livebridge_liveblog import LiveblogTarget
+from benchmarks.fake_liveblog import FakeLiveblog
+
+IMAGE = os.path.join(os.path.dirname(__file__), "..", "tests", "test.jpg")
+TOKEN = "bench"
+
+
+async def upload_new_session(endpoint):
+    data = aiohttp.FormData()
+    with open(IMAGE, "rb") as img_file:
+        data.add_field("media", img_file, content_type="image/jpg")
+        connector = aiohttp.TCPConnector(ssl=False)
+        session = aiohttp.ClientSession(connector=connector, auth=aiohttp.BasicAuth(TOKEN, ""))
+        try:
+            async with session.post("{}/archive".format(endpoint), data=data) as resp:
+                return await resp.json()
+        finally:
+            await session.close()
+
+
+async def measure(func, count):
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        await func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    print("{:<16} mean {:7.3f}ms  p50 {:7.3f}ms  p99 {:7.3f}ms".format(
+        name, statistics.mean(timings), timings[len(timings) // 2],
+        timings[int(len(timings) * 0.99) - 1]))
+
+
+async def main(count):
+    fake = FakeLiveblog()
+    endpoint = await fake.start()
+    fake.tokens.add(TOKEN)
+    target = LiveblogTarget(config={"endpoint": endpoint, "target_id": "bench", "verify_ssl": False})
+    target.session_token = TOKEN
+    # measure uploads, not the reuse of already archived images
+    target._image_cache = None
+    img_item = {"item_type": "image", "tmp_path": IMAGE}
+    try:
+        report("new session", await measure(lambda: upload_new_session(endpoint), count))
+        report("pooled session", await measure(lambda: target._save_image(img_item), count))
+    finally:
+        await target.stop()
+        await fake.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(main(args.count))
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Import time of the plugin and its modules, measured with ``python -X importtime``.
+
+Every module is imported in a fresh interpreter, the cumulative time of the best of
+**--repeat** runs is reported together with the heavy dependencies it loaded.
+
+    python benchmarks/import_time.py [--repeat 5]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+MODULES = [
+    "livebridge_liveblog",
+    "livebridge_liveblog.metrics",
+    "livebridge_liveblog.post",
+    "livebridge_liveblog.converters",
+    "livebridge_liveblog.source",
+    "livebridge_liveblog.target",
+]
+
+DEPENDENCIES = ["aiohttp", "dateutil", "livebridge.base"]
+
+
+def import_time(module):
+    """Returns cumulative import time of **module** in microseconds and the names of all imported modules."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.getcwd(), os.environ.get("PYTHONPATH")])))
+    res = subprocess.run([sys.executable, "-X", "importtime", "-c", "import {}".format(module)],
+                         stderr=subprocess.PIPE, env=env, check=True)
+    total, imported = 0, set()
+    for line in res.stderr.decode("utf-8").splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = [s.strip() for s in line[len("import time:"):].split("|")]
+        if not cumulative.isdigit():
+            continue  # header
+        imported.add(name)
+        if name == module:
+            total = int(cumulative)
+    return total, imported
+
+
+def main(repeat):
+    for module in MODULES:
+        runs = [import_time(module) for _ in range(repeat)]
+        total = min(r[0] for r in runs)
+        loaded = [d for d in DEPENDENCIES if d in runs[0][1]]
+        print("{:<32} {:8.1f}ms  {}".format(module, total / 1000, ", ".join(loaded) or "-"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    main(args.repeat)
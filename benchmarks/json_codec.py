@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Decoding of post pages and encoding of post bodies per installed JSON codec.
+
+Pages are generated by :class:`benchmarks.fake_liveblog.FakeLiveblog` from the
+post fixture, with embeds and HTML texts as sent by Liveblog.
+
+    python benchmarks/json_codec.py [--posts 50] [--count 200]
+"""
+import argparse
+import json
+import time
+from livebridge_liveblog.common import JSON_CODECS, get_json_codec
+from benchmarks.fake_liveblog import FakeLiveblog
+
+
+def make_page(posts):
+    fake = FakeLiveblog(seed=1)
+    fake.base_url = "https://liveblog.example.com"
+    items = fake.add_posts("5e0c7a1bf1c2b4a9d0e1f2a3", posts, images=2, texts=8)
+    return json.dumps({"_items": items, "_meta": {"page": 1, "max_results": posts, "total": posts}}).encode("utf-8")
+
+
+def measure(func, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        func()
+    return (time.perf_counter() - start) / count * 1000
+
+
+def main(posts, count):
+    page = make_page(posts)
+    body = json.loads(page.decode("utf-8"))["_items"][0]
+    print("page: {} posts, {:.1f} KiB".format(posts, len(page) / 1024))
+    for name in JSON_CODECS:
+        codec = get_json_codec(name)
+        if codec.name != name:
+            print("{:<8} not installed".format(name))
+            continue
+        decode = measure(lambda: codec.loads(page), count)
+        encode = measure(lambda: codec.dumps(body), count * 10)
+        print("{:<8} decode page {:8.3f}ms  encode post {:8.4f}ms".format(name, decode, encode))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=50, help="posts per page")
+    parser.add_argument("--count", type=int, default=200)
+    args = parser.parse_args()
+    main(args.posts, args.count)
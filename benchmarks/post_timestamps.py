@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Timestamp parsing of LiveblogPost over the posts in tests/posts.json.
+
+    python benchmarks/post_timestamps.py [--rounds 200]
+"""
+import argparse
+import json
+import os.path
+import timeit
+from dateutil.parser import parse as parse_date
+from livebridge_liveblog import LiveblogPost
+from livebridge_liveblog.post import parse_timestamp
+
+POSTS = os.path.join(os.path.dirname(__file__), "..", "tests", "posts.json")
+
+
+def main(rounds):
+    with open(POSTS) as f:
+        items = json.load(f)["_items"]
+    values = [i["_updated"] for i in items] + [i["_created"] for i in items]
+
+    def run(func):
+        seconds = min(timeit.repeat(lambda: [func(v) for v in values], number=rounds, repeat=3))
+        return seconds / (rounds * len(values)) * 1e6
+
+    print("dateutil         {:7.2f}us per timestamp".format(run(parse_date)))
+    print("parse_timestamp  {:7.2f}us per timestamp".format(run(parse_timestamp)))
+
+    # poll and livebridge access updated/created several times per post
+    def access():
+        for post in [LiveblogPost(i) for i in items]:
+            for _ in range(3):
+                post.updated
+            post.created
+    seconds = min(timeit.repeat(access, number=rounds, repeat=3))
+    print("LiveblogPost     {:7.2f}us per post (3x updated, 1x created)".format(
+        seconds / (rounds * len(items)) * 1e6))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+    main(args.rounds)
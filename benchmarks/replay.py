@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Replays the polls and target writes recorded on a tape.
+
+Tapes are recorded by bridges configured with *tape_path* and *tape_mode: record*,
+or by the end-to-end benchmark. Posts are polled, converted, created at the target
+and updated when polled again, all responses come from the tape. Images of recorded
+posts are downloaded from their original URLs, unreachable ones are skipped.
+
+    python benchmarks/end_to_end.py --tape /tmp/tape.jsonl.gz
+    python benchmarks/replay.py /tmp/tape.jsonl.gz [--speed 0]
+"""
+import argparse
+import asyncio
+import logging
+import time
+import tracemalloc
+from datetime import datetime
+from livebridge_liveblog import LiveblogLiveblogConverter, LiveblogSource, LiveblogTarget
+from livebridge_liveblog.tape import get_tape
+from benchmarks.end_to_end import Stage
+
+ENDPOINT = "https://liveblog.example.com/api"
+POLL_OPERATION = "GET client_blogs/{id}/posts"
+
+
+async def run_traced(stage, coro, posts=1):
+    # stages alternate per post, tracing is restarted to get the peak of this call only
+    tracemalloc.stop()
+    tracemalloc.start()
+    res = await stage.run(coro, posts)
+    stage.peak_memory = max(stage.peak_memory, tracemalloc.get_traced_memory()[1])
+    return res
+
+
+async def run(path, speed):
+    player = get_tape(path, "replay", speed=speed)
+    conf = {"endpoint": ENDPOINT, "label": "replay", "tape_path": path, "tape_mode": "replay"}
+    # ids are only part of the paths, other ids replay the same operations
+    source = LiveblogSource(config=dict(conf, source_id="replay"))
+    source.last_updated = datetime(2000, 1, 1)
+    target = LiveblogTarget(config=dict(conf, target_id="replay", auth={"user": "replay", "password": "replay"}))
+    converter = LiveblogLiveblogConverter()
+    stages = [Stage("poll"), Stage("convert"), Stage("write")]
+    docs, images = {}, []
+    start = time.perf_counter()
+    try:
+        while player.pending(POLL_OPERATION):
+            posts = await run_traced(stages[0], source.poll(), 0) or []
+            stages[0].posts += len(posts)
+            for post in posts:
+                conversion = await run_traced(stages[1], converter.convert(post.data))
+                if conversion is None:
+                    continue
+                post.content = conversion.content
+                images.extend(conversion.images)
+                if post.id in docs:
+                    post.target_doc = docs[post.id]
+                    docs[post.id] = await run_traced(stages[2], target.update_item(post)) or docs[post.id]
+                else:
+                    docs[post.id] = await run_traced(stages[2], target.post_item(post))
+    finally:
+        tracemalloc.stop()
+        await converter.remove_images(images)
+        converter._cache.clear()
+        await source.stop()
+        await target.stop()
+
+    for stage in stages:
+        print(stage.report())
+    print("replayed in {:.2f}s, {} requests left on tape, {} not found".format(
+        time.perf_counter() - start, len(player), player.missing))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("tape", help="tape file, gzip compressed when ending with .gz")
+    parser.add_argument("--speed", type=float, default=0, help="1 replays with original timing, 0 without delays")
+    args = parser.parse_args()
+    # images of recorded posts might not be reachable offline
+    logging.getLogger("livebridge_liveblog.converters").setLevel(logging.CRITICAL)
+    asyncio.get_event_loop().run_until_complete(run(args.tape, args.speed))
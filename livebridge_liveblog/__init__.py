@@ -13,7 +13,33 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from .source import LiveblogSource
-from .post import LiveblogPost
-from .target import LiveblogTarget
-from .converters import LiveblogLiveblogConverter
+import sys
+from importlib import import_module
+
+# public classes and their modules, imported on first access
+_lazy_attrs = {
+    "LiveblogSource": "source",
+    "LiveblogPost": "post",
+    "LiveblogTarget": "target",
+    "LiveblogLiveblogConverter": "converters",
+}
+
+__all__ = list(_lazy_attrs)
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        if name not in _lazy_attrs:
+            raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+        value = getattr(import_module("." + _lazy_attrs[name], __name__), name)
+        globals()[name] = value
+        return value
+
+    def __dir__():
+        # livebridge finds the plugin classes with inspect.getmembers()
+        return sorted(set(globals()) | set(_lazy_attrs))
+else:
+    # no module __getattr__ before Python 3.7 (PEP 562)
+    from .source import LiveblogSource
+    from .post import LiveblogPost
+    from .target import LiveblogTarget
+    from .converters import LiveblogLiveblogConverter
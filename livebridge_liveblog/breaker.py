@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+_breakers = {}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request to a Liveblog instance, which is considered down."""
+    pass
+
+
+def get_circuit_breaker(endpoint, *, threshold=None, reset_timeout=None):
+    """Returns the circuit breaker shared by all clients of the Liveblog instance at **endpoint**.
+
+    The settings of the first client apply, other values are logged as conflict.
+
+    :param endpoint: API endpoint of the Liveblog
+    :param threshold: consecutive failures opening the circuit, default 5
+    :param reset_timeout: seconds until a trial request is let through an open circuit, default 30
+    :returns: :class:`CircuitBreaker`"""
+    breaker = _breakers.get(endpoint)
+    if breaker is None:
+        breaker = _breakers[endpoint] = CircuitBreaker(
+            endpoint, threshold=5 if threshold is None else threshold,
+            reset_timeout=30 if reset_timeout is None else reset_timeout)
+    elif threshold not in (None, breaker.threshold) or reset_timeout not in (None, breaker.reset_timeout):
+        logger.warning("Conflicting circuit breaker threshold {}, timeout {} for {}, keeping {}, {}".format(
+            threshold, reset_timeout, endpoint, breaker.threshold, breaker.reset_timeout))
+    return breaker
+
+
+class CircuitBreaker(object):
+    """Stops requests to a Liveblog instance after **threshold** consecutive failures.
+
+    After **reset_timeout** seconds a single trial request is allowed, its success closes \
+    the circuit again, its failure keeps it open for another **reset_timeout**."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, endpoint, *, threshold=5, reset_timeout=30):
+        self.endpoint = endpoint
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0
+
+    def __repr__(self):
+        return "<CircuitBreaker {} [{}]>".format(self.endpoint, self.state)
+
+    def allow(self):
+        """Returns True when a request may be sent."""
+        if self.state == self.CLOSED:
+            return True
+        # open, or half-open with a trial request lost without result
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self._opened_at = time.monotonic()
+            return True
+        return False
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info("Liveblog {} is reachable again, closing circuit.".format(self.endpoint))
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+            if self.state != self.OPEN:
+                logger.warning("Liveblog {} failed {} times, opening circuit for {}s.".format(
+                    self.endpoint, self.failures, self.reset_timeout))
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import hashlib
+import json
+import logging
+import os.path
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+_image_caches = {}
+
+
+def file_digest(path, chunk_size=65536):
+    """Returns sha256 hex digest of the file at **path**."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_image_cache(endpoint, *, size=1000, path=None):
+    """Returns the image cache shared by all targets of the Liveblog instance at **endpoint**.
+
+    :param endpoint: API endpoint of the target Liveblog
+    :param size: maximum number of images kept
+    :param path: optional file for persisting the cache between restarts
+    :returns: :class:`ImageCache`"""
+    if endpoint not in _image_caches:
+        _image_caches[endpoint] = ImageCache(size=size, path=path)
+    return _image_caches[endpoint]
+
+
+class LRUCache(object):
+    """Dictionary like cache, which drops the least recently used entry when **size** is exceeded."""
+
+    def __init__(self, size):
+        self.size = size
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def get(self, key, default=None):
+        if key not in self._data:
+            return default
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def set(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.size:
+            self._evict(*self._data.popitem(last=False))
+
+    def _evict(self, key, value):
+        """Called with entries dropped because of the size limit."""
+        pass
+
+    def pop(self, key, default=None):
+        return self._data.pop(key, default)
+
+    def clear(self):
+        self._data.clear()
+
+    def items(self):
+        return self._data.items()
+
+
+class ImageCache(LRUCache):
+    """Maps the content hash of image files to the archive resource at the target.
+
+    With **path**, new entries are appended as JSON lines to that file, which is \
+    loaded on start and compacted when it grew to twice the cache **size**."""
+
+    def __init__(self, *, size=1000, path=None):
+        super().__init__(size)
+        self.path = path
+        self._lines = 0
+        if self.path and os.path.exists(self.path):
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    super().set(entry["hash"], entry["resource"])
+                    self._lines += 1
+            logger.info("Loaded {} cached images from {}".format(len(self), self.path))
+        except Exception as e:
+            logger.error("Loading image cache {} failed.".format(self.path))
+            logger.exception(e)
+
+    def set(self, key, value):
+        super().set(key, value)
+        if not self.path:
+            return
+        try:
+            if self._lines >= 2 * self.size:
+                self._compact()
+            else:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps({"hash": key, "resource": value}) + "\n")
+                self._lines += 1
+        except Exception as e:
+            logger.error("Writing image cache {} failed.".format(self.path))
+            logger.exception(e)
+
+    def _compact(self):
+        tmp_path = "{}.tmp".format(self.path)
+        with open(tmp_path, "w") as f:
+            for key, value in self.items():
+                f.write(json.dumps({"hash": key, "resource": value}) + "\n")
+        os.replace(tmp_path, self.path)
+        self._lines = len(self)
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import logging
+import os
+import os.path
+from livebridge_liveblog.post import parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+_checkpoint_stores = {}
+
+
+def get_checkpoint_store(path):
+    """Returns the checkpoint store for the file at **path**, shared by all sources of the process.
+
+    :param path: file of the checkpoints
+    :returns: :class:`CheckpointStore`"""
+    if path not in _checkpoint_stores:
+        _checkpoint_stores[path] = CheckpointStore(path)
+    return _checkpoint_stores[path]
+
+
+class CheckpointStore(object):
+    """Keeps the *last_updated* cursor of sources in a local file.
+
+    All checkpoints are read at once when the store is created. Changes are appended \
+    as JSON lines, the file is rewritten when it holds more than twice the needed lines."""
+
+    def __init__(self, path):
+        self.path = path
+        self._checkpoints = {}
+        self._lines = 0
+        if os.path.exists(self.path):
+            self._load()
+
+    def __len__(self):
+        return len(self._checkpoints)
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    self._lines += 1
+                    try:
+                        entry = json.loads(line)
+                        self._checkpoints[entry["key"]] = entry["updated"]
+                    except (ValueError, KeyError):
+                        # e.g. last line cut off by a crash
+                        logger.warning("Skipping invalid checkpoint line in {}".format(self.path))
+            logger.info("Loaded {} checkpoints from {}".format(len(self), self.path))
+        except Exception as e:
+            logger.error("Loading checkpoints {} failed.".format(self.path))
+            logger.exception(e)
+
+    def get(self, key):
+        """Returns the checkpoint of **key** as :py:class:`datetime.datetime` or None."""
+        value = self._checkpoints.get(key)
+        return parse_timestamp(value) if value else None
+
+    def set(self, key, updated):
+        value = updated.isoformat()
+        if self._checkpoints.get(key) == value:
+            return
+        self._checkpoints[key] = value
+        try:
+            # some slack, otherwise a few sources would rewrite the file on every poll
+            if self._lines >= 2 * len(self) + 100:
+                self._compact()
+            else:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps({"key": key, "updated": value}) + "\n")
+                self._lines += 1
+        except Exception as e:
+            logger.error("Writing checkpoint {} failed.".format(self.path))
+            logger.exception(e)
+
+    def _compact(self):
+        tmp_path = "{}.tmp".format(self.path)
+        with open(tmp_path, "w") as f:
+            for key, value in self._checkpoints.items():
+                f.write(json.dumps({"key": key, "updated": value}) + "\n")
+        os.replace(tmp_path, self.path)
+        self._lines = len(self)
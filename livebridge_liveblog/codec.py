@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import logging
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# JSON codecs by preference, the first installed one is used
+JSON_CODECS = ("orjson", "ujson", "json")
+
+
+class JSONCodec(object):
+    """Encodes request bodies straight to bytes and decodes response bodies given as bytes."""
+
+    def __init__(self, name, dumps, loads):
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+
+    def __repr__(self):
+        return "<JSONCodec {}>".format(self.name)
+
+
+def _make_orjson_codec():
+    import orjson
+    return JSONCodec("orjson", orjson.dumps, orjson.loads)
+
+
+def _make_ujson_codec():
+    import ujson
+    return JSONCodec("ujson", lambda obj: ujson.dumps(
+        obj, ensure_ascii=False, escape_forward_slashes=False).encode("utf-8"), ujson.loads)
+
+
+def _make_json_codec():
+    return JSONCodec("json", lambda obj: json.dumps(obj).encode("utf-8"), json.loads)
+
+
+_codec_factories = {"orjson": _make_orjson_codec, "ujson": _make_ujson_codec, "json": _make_json_codec}
+
+
+@lru_cache(maxsize=None)
+def get_json_codec(name=None):
+    """Returns the JSON codec **name**, by default the first installed one of :data:`JSON_CODECS`.
+
+    :param name: *orjson*, *ujson* or *json*, falls back to *json* when not installed
+    :returns: :class:`JSONCodec`"""
+    for codec_name in ([name] if name else JSON_CODECS):
+        try:
+            return _codec_factories[codec_name]()
+        except (ImportError, KeyError):
+            if name:
+                logger.warning("JSON codec {} is not available, using json.".format(name))
+    return _make_json_codec()
@@ -16,14 +16,40 @@
 import aiohttp
 import asyncio
 import base64
-import json
 import logging
+import random
+import time
+from collections import Counter
 from os.path import join as path_join
 from urllib.parse import urlencode, urljoin
 from livebridge.base import InvalidTargetResource
+from livebridge_liveblog.breaker import CircuitOpenError, get_circuit_breaker
+from livebridge_liveblog.cache import LRUCache
+from livebridge_liveblog.codec import JSON_CODECS, JSONCodec, get_json_codec  # noqa: F401 re-exported
+from livebridge_liveblog.metrics import get_operation, request_metrics
+from livebridge_liveblog.ratelimit import PRIORITY_HIGH, PRIORITY_NORMAL, get_rate_limiter
+from livebridge_liveblog.stream import JSONItemStream
+from livebridge_liveblog.tape import acquire_tape, release_tape
 
 logger = logging.getLogger(__name__)
 
+JSON_CONTENT_TYPE = "application/json;charset=utf-8"
+
+# methods retried after connection errors and RETRY_STATUSES
+IDEMPOTENT_METHODS = ("get", "head")
+RETRY_STATUSES = (500, 502, 503, 504)
+RETRY_EXCEPTIONS = (aiohttp.ClientError, asyncio.TimeoutError)
+
+# methods of requests limited by write_rate, updates and deletes are sent as PATCH and go first
+RATE_LIMITED_METHODS = ("post", "put", "patch", "delete")
+PRIORITY_METHODS = ("patch", "delete")
+
+# size of the chunks read from streamed responses
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# process-wide counters of conditional GET requests: hits, misses, bytes_saved
+conditional_get_stats = Counter()
+
 def comma_split(s):
     return tuple(map(lambda a: a.strip(), s.split(",")))
 
@@ -33,6 +59,9 @@ class LiveblogClient(object):
 
     def __init__(self, *, config={}, **kwargs):
         self.session_token = None
+        self._token_expires = 0
+        self._token_ttl = int(config.get("token_ttl", 3600))
+        self._login_future = None
         self.last_updated = None
         auth_creds = config.get("auth", {})
         self.user = auth_creds.get("user")
@@ -52,11 +81,38 @@ class LiveblogClient(object):
                 filter_tags = comma_split(filter_tags)
         self.filter_tags = filter_tags
         self._session = None
+        self._conn_limit = int(config.get("conn_limit", 100))
+        self._keepalive_timeout = float(config.get("keepalive_timeout", 30))
+
+        self._conditional_get = config.get("conditional_get", True)
+        self._validators = LRUCache(int(config.get("validator_cache_size", 100)))
+        self._metrics = request_metrics if config.get("metrics", True) else None
+        self._json = get_json_codec(config.get("json_codec"))
+        # bytes of all response bodies received by this client
+        self.bytes_received = 0
+
+        self._retries = max(0, int(config.get("retries", 2)))
+        self._retry_backoff = float(config.get("retry_backoff", 0.5))
+        self._retry_max_backoff = float(config.get("retry_max_backoff", 10))
+        breaker_threshold = int(config.get("circuit_breaker_threshold", 5))
+        self._breaker = get_circuit_breaker(
+            self.endpoint, threshold=breaker_threshold,
+            reset_timeout=float(config.get("circuit_breaker_timeout", 30))) if breaker_threshold > 0 else None
+        write_rate = float(config.get("write_rate", 0))
+        if write_rate > 0:
+            get_rate_limiter(self.endpoint, rate=write_rate, burst=int(config.get("write_burst", 10)))
+        # record requests to a tape file or answer them from it
+        tape_path = config.get("tape_path")
+        self._tape = acquire_tape(tape_path, config.get("tape_mode", "replay"),
+                                  speed=float(config.get("tape_speed", 1))) if tape_path else None
 
         self._source_meta = {}
         self._source_status = True
         self._source_check_interval = int(config.get("source_check_interval", 600))
+        self._max_source_check_interval = max(
+            self._source_check_interval, int(config.get("max_source_check_interval", 3600)))
         self._source_check_handler = None
+        self._closed_checks = 0
 
     def __repr__(self):
         return "<Liveblog [{}] {}client_blogs/{}>".format(self.label, self.endpoint, self.source_id or self.target_id)
@@ -68,11 +124,10 @@ class LiveblogClient(object):
     def session(self):
         if self._session:
             return self._session
-        headers = {"Content-Type": "application/json;charset=utf-8"}
-        if self.session_token:
-            headers.update(self._get_auth_header())
-        conn = aiohttp.TCPConnector(ssl=self.verify_ssl)
-        self._session = aiohttp.ClientSession(connector=conn, headers=headers, conn_timeout=10)
+        # no default headers, auth and content type are set per request
+        conn = aiohttp.TCPConnector(ssl=self.verify_ssl, limit=self._conn_limit,
+                                    keepalive_timeout=self._keepalive_timeout)
+        self._session = aiohttp.ClientSession(connector=conn, conn_timeout=10)
         return self._session
 
     async def stop(self):
@@ -82,60 +137,292 @@ class LiveblogClient(object):
         if self._session:
             await self._session.close()
 
+        if self._tape is not None:
+            # flushes and closes a recorded tape, when no other client uses it
+            release_tape(self._tape)
+            self._tape = None
+
+    @property
+    def _login_url(self):
+        return "{}/auth".format(self.endpoint)
+
+    def _has_valid_token(self):
+        return bool(self.session_token) and time.monotonic() < self._token_expires
+
+    async def _ensure_login(self):
+        """Returns the cached session token, logs in only when there is none or it is expired."""
+        if self._has_valid_token():
+            return self.session_token
+        return await self._login()
+
     async def _login(self):
-        params = json.dumps({"username": self.user, "password": self.password})
-        login_url = "{}/auth".format(self.endpoint)
+        """Logs in at the Liveblog instance, concurrent callers share one in-flight login."""
+        if self._login_future is None:
+            self._login_future = asyncio.ensure_future(self._request_token())
+            self._login_future.add_done_callback(self._reset_login_future)
+        return await asyncio.shield(self._login_future)
+
+    def _reset_login_future(self, future):
+        if self._login_future is future:
+            self._login_future = None
+
+    async def _request_token(self):
+        params = self._json.dumps({"username": self.user, "password": self.password})
         try:
-            resp = await self._post(login_url, params, status=201)
-            if resp.get("token"):
+            resp = await self._post(self._login_url, params, status=201)
+            if resp and resp.get("token"):
                 self.session_token = resp["token"]
-                # reset session
-                if self._session:
-                    self._session.close()
-                    self._session = None
+                self._token_expires = time.monotonic() + self._token_ttl
+                self._observe_login(True)
                 return self.session_token
         except aiohttp.client_exceptions.ClientOSError as e:
-            logger.error("Login failed for [{}] - {}".format(self, login_url))
+            logger.error("Login failed for [{}] - {}".format(self, self._login_url))
             logger.error(e)
+        self._observe_login(False)
         return False
 
+    def _observe_login(self, success):
+        if self._metrics is not None:
+            self._metrics.observe_login(self.endpoint, success)
+
+    async def _refresh_token(self, token):
+        """Called after a 401 response for a request sent with **token**."""
+        if self.session_token and self.session_token != token:
+            # token was already renewed by another request
+            return self.session_token
+        return await self._login()
+
+    def _get_json_headers(self, headers=None):
+        json_headers = {"Content-Type": JSON_CONTENT_TYPE}
+        if headers:
+            json_headers.update(headers)
+        return json_headers
+
+    def _get_request_headers(self, url, headers=None):
+        req_headers = dict(headers) if headers else {}
+        if self.session_token and url != self._login_url:
+            req_headers.update(self._get_auth_header())
+        return req_headers
+
+    def _get_retry_delay(self, attempt):
+        # exponential backoff with full jitter
+        return random.uniform(0, min(self._retry_max_backoff, self._retry_backoff * 2 ** attempt))
+
+    @property
+    def _rate_limiter(self):
+        # shared by all clients of the endpoint, also when only another one set write_rate
+        return get_rate_limiter(self.endpoint)
+
+    async def _send(self, method, url, data, headers, stream=None):
+        # rejected requests don't use up write budget
+        if self._breaker is not None and not self._breaker.allow():
+            raise CircuitOpenError("Circuit open for {}".format(self.endpoint))
+        rate_limiter = self._rate_limiter
+        if rate_limiter is not None and method in RATE_LIMITED_METHODS and url != self._login_url:
+            await rate_limiter.acquire(PRIORITY_HIGH if method in PRIORITY_METHODS else PRIORITY_NORMAL)
+        body = data() if callable(data) else data
+        start = time.perf_counter()
+        try:
+            status, resp_headers, content, received = await self._receive(method, url, body, headers, stream)
+        except Exception:
+            self._observe_request(method, url, "error", start, body, 0)
+            if self._breaker is not None:
+                self._breaker.record_failure()
+            raise
+        self.bytes_received += received
+        self._observe_request(method, url, status, start, body, received)
+        if self._breaker is not None:
+            if status >= 500:
+                self._breaker.record_failure()
+            else:
+                self._breaker.record_success()
+        return status, resp_headers, content
+
+    async def _receive(self, method, url, body, headers, stream):
+        """Sends the request, or replays it from the tape, returns status, headers, body and bytes received."""
+        if self._tape is not None and self._tape.mode == "replay":
+            status, resp_headers, content = await self._tape.play(self.endpoint, method, url)
+            if stream is not None and status == 200:
+                consumer = stream()
+                consumer.feed(content)
+                consumer.close()
+                return status, resp_headers, b"", len(content)
+            return status, resp_headers, content, len(content)
+
+        start = time.monotonic()
+        chunks = []
+        async with getattr(self.session, method)(
+                url, data=body, headers=self._get_request_headers(url, headers)) as resp:
+            status = resp.status
+            resp_headers = resp.headers
+            if stream is not None and status == 200:
+                # body is passed on chunk by chunk instead of being returned
+                consumer = stream()
+                content = b""
+                received = 0
+                async for chunk in resp.content.iter_chunked(STREAM_CHUNK_SIZE):
+                    received += len(chunk)
+                    consumer.feed(chunk)
+                    if self._tape is not None:
+                        chunks.append(chunk)
+                consumer.close()
+            else:
+                content = await resp.read()
+                received = len(content)
+                chunks.append(content)
+        if self._tape is not None:
+            # tapes must not hold credentials or session tokens
+            self._tape.record(self.endpoint, method, url, status, resp_headers, b"".join(chunks),
+                              duration=time.monotonic() - start, body=body, redact=url == self._login_url)
+        return status, resp_headers, content, received
+
+    async def _request(self, method, url, *, data=None, headers=None, idempotent=None, stream=None):
+        """Sends a request with the current session token, returns status code, headers and body.
+
+        When the token got rejected with 401, the client logs in again and repeats the
+        request once. **data** can be a callable, which builds the request body per attempt.
+        **stream** can be a callable, which returns a consumer per attempt. The body of a
+        200 response is fed to the consumer while it is received and returned empty.
+
+        Idempotent requests, by default GET only, are retried up to *retries* times after
+        connection errors and 5xx responses."""
+        idempotent = method in IDEMPOTENT_METHODS if idempotent is None else idempotent
+        retries = self._retries if idempotent else 0
+        relogin = True
+        attempt = 0
+        while True:
+            token = self.session_token
+            try:
+                status, resp_headers, content = await self._send(method, url, data, headers, stream)
+            except RETRY_EXCEPTIONS as e:
+                if attempt >= retries:
+                    raise
+                logger.warning("Request failed for [{}] - {} {}: {!r}, retrying.".format(self, method.upper(), url, e))
+            else:
+                if status == 401 and relogin and self.user and url != self._login_url:
+                    relogin = False
+                    logger.info("Session token rejected, login again for [{}]".format(self))
+                    if await self._refresh_token(token):
+                        continue
+                if status not in RETRY_STATUSES or attempt >= retries:
+                    return status, resp_headers, content
+                logger.warning("Request failed for [{}] - {} {} [{}], retrying.".format(
+                    self, method.upper(), url, status))
+            await asyncio.sleep(self._get_retry_delay(attempt))
+            attempt += 1
+
+    def _observe_request(self, method, url, status, start, body, received):
+        if self._metrics is None:
+            return
+        self._metrics.observe(
+            self.endpoint, get_operation(self.endpoint, method, url), status, time.perf_counter() - start,
+            bytes_in=received, bytes_out=len(body) if isinstance(body, (bytes, str)) else 0)
+
+    @staticmethod
+    def _encode_body(data):
+        return data if isinstance(data, bytes) else data.encode("utf-8")
+
     async def _post(self, url, data, status=200, headers=None):
         try:
-            async with self.session.post(url, data=data.encode(), headers=headers) as resp:
-                if resp.status == status:
-                    return await resp.json()
-                else:
-                    logger.error("POST failed: {} [{}]".format(await resp.text(), resp.status))
-                    raise Exception()
+            resp_status, _, content = await self._request(
+                "post", url, data=self._encode_body(data), headers=self._get_json_headers(headers))
+            if resp_status == status:
+                return self._json.loads(content)
+            else:
+                logger.error("POST failed: {} [{}]".format(content.decode("utf-8", "replace"), resp_status))
+                raise Exception()
         except Exception as e:
             logger.error("Posting post failed for [{}] - {}".format(self, url))
             logger.exception(e)
 
     async def _patch(self, url, data, status=200, etag=None):
         try:
-            headers = {"If-Match": etag} if etag else None
-            async with self.session.patch(url, data=data.encode(), headers=headers) as resp:
-                if resp.status == status:
-                    return await resp.json()
-                elif resp.status == 412:
-                    raise InvalidTargetResource("Resource was edited at target, can't be updated anymore. {}".format(await resp.text()))
-                else:
-                    logger.error("PATCH failed: {} [{}]".format(await resp.text(), resp.status))
-                    raise Exception()
+            headers = self._get_json_headers({"If-Match": etag} if etag else None)
+            resp_status, _, content = await self._request("patch", url, data=self._encode_body(data), headers=headers)
+            if resp_status == status:
+                return self._json.loads(content)
+            elif resp_status == 412:
+                raise InvalidTargetResource("Resource was edited at target, can't be updated anymore. {}".format(
+                    content.decode("utf-8", "replace")))
+            else:
+                logger.error("PATCH failed: {} [{}]".format(content.decode("utf-8", "replace"), resp_status))
+                raise Exception()
         except InvalidTargetResource:
             raise
         except Exception as e:
             logger.error("Patching post failed for [{}] - {}".format(self, url))
             logger.exception(e)
 
+    @staticmethod
+    def _get_validator_key(url):
+        # posts URLs carry the moving cursor, only the latest response per path can be hit again
+        return url.split("?", 1)[0]
+
+    def _get_validators(self, url):
+        validators = self._validators.get(self._get_validator_key(url))
+        return validators if validators and validators["url"] == url else None
+
+    def _get_validator_headers(self, url):
+        headers = {}
+        validators = self._get_validators(url)
+        if validators:
+            if validators.get("etag"):
+                headers["If-None-Match"] = validators["etag"]
+            if validators.get("last_modified"):
+                headers["If-Modified-Since"] = validators["last_modified"]
+        return headers
+
+    def _store_validators(self, url, headers, content):
+        key = self._get_validator_key(url)
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        if not etag and not last_modified:
+            self._validators.pop(key, None)
+            return
+        self._validators.set(key, {"url": url, "etag": etag, "last_modified": last_modified, "content": content})
+
     async def _get(self, url, *, status=200):
         try:
-            async with self.session.get(url) as resp:
-                if resp.status == status:
-                    return await resp.json()
-                else:
-                    logger.warning("No data got fetched! [Status: {}] - {}".format(resp.status, url))
+            headers = self._get_validator_headers(url) if self._conditional_get else None
+            resp_status, resp_headers, content = await self._request("get", url, headers=headers)
+            validators = self._get_validators(url) if resp_status == 304 else None
+            if validators:
+                # not modified, use body of last response
+                content = validators["content"]
+                conditional_get_stats["hits"] += 1
+                conditional_get_stats["bytes_saved"] += len(content)
+                return self._json.loads(content)
+            elif resp_status == status:
+                if self._conditional_get:
+                    conditional_get_stats["misses"] += 1
+                    self._store_validators(url, resp_headers, content)
+                return self._json.loads(content)
+            else:
+                logger.warning("No data got fetched! [Status: {}] - {}".format(resp_status, url))
         except Exception as e:
             logger.error("Requesting posts failed for [{}] {}client_blogs/{}".format(self.label or "-", self.endpoint, self.source_id))
             logger.error(e)
         return {}
+
+    async def _get_stream(self, url, key, callback, *, status=200):
+        """Like :meth:`_get`, but passes the elements of the list **key** in the response to \
+        **callback** while the response is received, returns the other members of the response \
+        or None, when the request failed.
+
+        Conditional requests are not used, they would need the whole body to be kept."""
+        streams = []
+
+        def start_stream():
+            # retried requests start over, callers have to cope with repeated items
+            streams.append(JSONItemStream(key, callback))
+            return streams[-1]
+
+        try:
+            resp_status, _, content = await self._request("get", url, stream=start_stream)
+            if resp_status == status:
+                return streams[-1].meta
+            logger.warning("No data got fetched! [Status: {}] - {}".format(resp_status, url))
+        except Exception as e:
+            logger.error("Requesting posts failed for [{}] {}client_blogs/{}".format(self.label or "-", self.endpoint, self.source_id))
+            logger.error(e)
+        return None
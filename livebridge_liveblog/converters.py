@@ -13,17 +13,157 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import asyncio
 import logging
+import os
+import os.path
+from collections import Counter
 from livebridge.base import BaseConverter, ConversionResult
+from livebridge_liveblog.cache import LRUCache
 
 
 logger = logging.getLogger(__name__)
 
+_conversion_caches = {}
+
+
+def get_conversion_cache(key, *, size=500):
+    """Returns the conversion cache shared by all converters of the process with **key**.
+
+    livebridge creates a new converter for every post, the cache has to outlive it.
+
+    :param key: converter, e.g. tuple of source and target type
+    :param size: maximum number of converted items kept
+    :returns: :class:`ConversionCache`"""
+    if key not in _conversion_caches:
+        _conversion_caches[key] = ConversionCache(size)
+    return _conversion_caches[key]
+
+
+class ConversionCache(LRUCache):
+    """Converted items by item type and *_id*, with the *_etag* or *_updated* they were converted from.
+
+    Downloaded images belong to the cache, their files are removed when the entry is \
+    dropped or replaced by a newer version of the item. Files still used by a conversion, \
+    e.g. of another bridge uploading them, are removed when the last one released them."""
+
+    def __init__(self, size):
+        super().__init__(size)
+        self.images = set()
+        # conversions using a downloaded image, until the converter removes its images
+        self._users = Counter()
+
+    @staticmethod
+    def get_key(item):
+        """Returns key and version of a ref's **item**, None if it can't be cached."""
+        version = item.get("_etag") or item.get("_updated")
+        if not item.get("_id") or not version:
+            return None, None
+        return (item.get("item_type"), item["_id"]), version
+
+    def get_content(self, key, version):
+        entry = self.get(key)
+        if entry is None or entry[0] != version:
+            return None
+        _, content, tmp_path = entry
+        if tmp_path and not os.path.exists(tmp_path):
+            # removed by someone else
+            self.pop(key)
+            return None
+        return dict(content), tmp_path
+
+    def set_content(self, key, version, content, tmp_path=None):
+        old = self._data.get(key)
+        if old is not None and old[0] == version:
+            # converted concurrently, e.g. an image used twice in a post, keep the first
+            return
+        old = self.pop(key)
+        if old is not None and old[2] != tmp_path:
+            self._remove_image(old[2])
+        if tmp_path:
+            self.images.add(tmp_path)
+        self.set(key, (version, dict(content), tmp_path))
+
+    def pop(self, key, default=None):
+        entry = super().pop(key, default)
+        if entry is not default and entry[2]:
+            self.images.discard(entry[2])
+        return entry
+
+    def clear(self):
+        for _, _, tmp_path in self._data.values():
+            self._remove_image(tmp_path)
+        super().clear()
+
+    def _evict(self, key, value):
+        self._remove_image(value[2])
+
+    def acquire(self, tmp_path):
+        """Marks the cached image **tmp_path** as used by a conversion."""
+        self._users[tmp_path] += 1
+
+    def release(self, tmp_path):
+        """Returns False if **tmp_path** was not acquired, removes it when the last user released \
+        a file, which isn't cached anymore."""
+        if not self._users.get(tmp_path):
+            return False
+        self._users[tmp_path] -= 1
+        if not self._users[tmp_path]:
+            del self._users[tmp_path]
+            if tmp_path not in self.images:
+                self._remove_image(tmp_path)
+        return True
+
+    def _remove_image(self, tmp_path):
+        if not tmp_path:
+            return
+        self.images.discard(tmp_path)
+        if self._users.get(tmp_path):
+            # removed on release
+            return
+        try:
+            os.remove(tmp_path)
+        except OSError as e:
+            logger.warning("Removing cached image {} failed: {}".format(tmp_path, e))
+
 
 class LiveblogLiveblogConverter(BaseConverter):
 
     source = "liveblog"
     target = "liveblog"
+    # maximum of parallel image downloads per post
+    image_concurrency = 4
+    # converted items kept for unchanged items of updated posts, 0 disables the cache
+    cache_size = 500
+
+    def __init__(self):
+        super().__init__()
+        self._cache = get_conversion_cache(
+            (self.source, self.target), size=self.cache_size) if self.cache_size else None
+
+    async def remove_images(self, images):
+        """Removes downloaded images, the ones of the conversion cache only when they're not used anymore."""
+        if self._cache is not None:
+            images = [i for i in images if not self._cache.release(i) and i not in self._cache.images]
+        await super().remove_images(images)
+
+    async def _convert_cached(self, item, convert):
+        """Returns converted content and image path of **item**, converts it with **convert** only \
+        when it's not cached or changed since."""
+        key, version = self._cache.get_key(item["item"]) if self._cache is not None else (None, None)
+        if key is not None:
+            cached = self._cache.get_content(key, version)
+            if cached is not None:
+                if cached[1]:
+                    self._cache.acquire(cached[1])
+                return cached
+        res = await convert(item)
+        content, tmp_path = res if isinstance(res, tuple) else (res, None)
+        if key is not None and content:
+            self._cache.set_content(key, version, content, tmp_path)
+            if tmp_path in self._cache.images:
+                self._cache.acquire(tmp_path)
+        return content, tmp_path
 
     async def _convert_image(self, item):
         logger.debug("[liveblog -> liveblog] converting image")
@@ -65,6 +205,20 @@ class LiveblogLiveblogConverter(BaseConverter):
     async def convert(self, post):
         post_items = []
         images = []
+        downloads = []
+        semaphore = asyncio.Semaphore(self.image_concurrency)
+
+        async def download_image(item):
+            async with semaphore:
+                return await self._convert_image(item)
+
+        async def convert_image(item):
+            return await self._convert_cached(item, download_image)
+
+        async def convert(item, func):
+            content, _ = await self._convert_cached(item, func)
+            return content
+
         logger.debug("[liveblog -> liveblog] convert")
         logger.debug(post)
         try:
@@ -74,25 +228,31 @@ class LiveblogLiveblogConverter(BaseConverter):
 
                 for item in g["refs"]:
                     if item["item"]["item_type"] == "text":
-                        post_items.append(await self._convert_text(item))
+                        post_items.append(await convert(item, self._convert_text))
                     elif item["item"]["item_type"] == "quote":
-                        post_items.append(await self._convert_quote(item))
+                        post_items.append(await convert(item, self._convert_quote))
                     elif item["item"]["item_type"] == "image":
-                        content, img_path = await self._convert_image(item)
-                        post_items.append(content)
-                        if img_path:
-                            images.append(img_path)
+                        # download in background, keep position of item
+                        downloads.append((len(post_items), asyncio.ensure_future(convert_image(item))))
+                        post_items.append(None)
                     elif item["item"]["item_type"] == "embed":
-                        post_items.append(await self._convert_embed(item))
+                        post_items.append(await convert(item, self._convert_embed))
                     else:
                         logger.debug("[liveblog -> liveblog] unknown conversion")
                         logger.debug("Type: {}".format(item["type"]))
                         logger.debug("Item-Type: {}".format(item["item"]["item_type"]))
                         logger.debug(item)
                         logger.debug("\n\n")
-            # filter empty items
-            post_items = list(filter(None, post_items))
         except Exception as e:
             logger.error("Converting post failed.")
             logger.exception(e)
+
+        # wait for image downloads, also after a failure, so their files get removed later
+        for pos, task in downloads:
+            content, img_path = await task
+            post_items[pos] = content
+            if img_path:
+                images.append(img_path)
+        # filter empty items
+        post_items = list(filter(None, post_items))
         return ConversionResult(content=post_items, images=images)
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import bisect
+import logging
+from collections import Counter, defaultdict
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of the latency buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# path segments of the Liveblog API, all others are ids
+_RESOURCES = {"auth", "client_blogs", "posts", "items", "archive", "blogs"}
+
+
+def get_operation(endpoint, method, url):
+    """Returns label like ``GET client_blogs/{id}/posts`` for a request of **method** to **url**."""
+    path = url[len(endpoint):] if url.startswith(endpoint) else url
+    path = path.split("?", 1)[0].strip("/")
+    segments = [s if s in _RESOURCES else "{id}" for s in path.split("/") if s]
+    return "{} {}".format(method.upper(), "/".join(segments))
+
+
+class _Histogram(object):
+
+    __slots__ = ["buckets", "count", "sum"]
+
+    def __init__(self, size):
+        self.buckets = [0] * size
+        self.count = 0
+        self.sum = 0.0
+
+
+class RequestMetrics(object):
+    """Collects latency, status and payload sizes of requests sent by :class:`LiveblogClient`.
+
+    Samples are aggregated per Liveblog endpoint, operation and status and can be exported \
+    with :func:`to_prometheus`. Callbacks added with :func:`add_callback` get every single sample."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.callbacks = []
+        self.reset()
+
+    def reset(self):
+        self.latency = defaultdict(lambda: _Histogram(len(self.buckets)))
+        self.bytes_in = Counter()
+        self.bytes_out = Counter()
+        self.logins = Counter()
+        self.polls = Counter()
+        self.poll_bytes = Counter()
+        self.poll_posts = Counter()
+
+    def add_callback(self, callback):
+        """Registers **callback**, which is called with a dictionary per request sample."""
+        self.callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        self.callbacks.remove(callback)
+
+    def _notify(self, sample):
+        for callback in self.callbacks:
+            try:
+                callback(sample)
+            except Exception as e:
+                logger.error("Metrics callback {} failed.".format(callback))
+                logger.exception(e)
+
+    def observe(self, endpoint, operation, status, duration, *, bytes_in=0, bytes_out=0):
+        """Records one request, **status** is the HTTP status code or ``error`` when no response was received."""
+        key = (endpoint, operation, str(status))
+        hist = self.latency[key]
+        pos = bisect.bisect_left(self.buckets, duration)
+        if pos < len(self.buckets):
+            hist.buckets[pos] += 1
+        hist.count += 1
+        hist.sum += duration
+        self.bytes_in[key] += bytes_in
+        self.bytes_out[key] += bytes_out
+        if self.callbacks:
+            self._notify({"type": "request", "endpoint": endpoint, "operation": operation, "status": status,
+                          "duration": duration, "bytes_in": bytes_in, "bytes_out": bytes_out})
+
+    def observe_login(self, endpoint, success):
+        result = "success" if success else "failure"
+        self.logins[(endpoint, result)] += 1
+        if self.callbacks:
+            self._notify({"type": "login", "endpoint": endpoint, "result": result})
+
+    def observe_poll(self, endpoint, bytes_in, posts):
+        """Records one poll of a source, which received **bytes_in** bytes for **posts** posts."""
+        self.polls[endpoint] += 1
+        self.poll_bytes[endpoint] += bytes_in
+        self.poll_posts[endpoint] += posts
+        if self.callbacks:
+            self._notify({"type": "poll", "endpoint": endpoint, "bytes_in": bytes_in, "posts": posts})
+
+    @staticmethod
+    def _labels(**labels):
+        return ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+                        for k, v in labels.items())
+
+    def to_prometheus(self, prefix="livebridge_liveblog"):
+        """Returns all metrics in the Prometheus text exposition format."""
+        lines = [
+            "# HELP {}_request_duration_seconds Latency of requests to Liveblog.".format(prefix),
+            "# TYPE {}_request_duration_seconds histogram".format(prefix),
+        ]
+        for (endpoint, operation, status), hist in sorted(self.latency.items()):
+            labels = self._labels(endpoint=endpoint, operation=operation, status=status)
+            cumulative = 0
+            for bound, count in zip(self.buckets, hist.buckets):
+                cumulative += count
+                lines.append('{}_request_duration_seconds_bucket{{{},le="{}"}} {}'.format(
+                    prefix, labels, bound, cumulative))
+            lines.append('{}_request_duration_seconds_bucket{{{},le="+Inf"}} {}'.format(prefix, labels, hist.count))
+            lines.append("{}_request_duration_seconds_sum{{{}}} {}".format(prefix, labels, hist.sum))
+            lines.append("{}_request_duration_seconds_count{{{}}} {}".format(prefix, labels, hist.count))
+        for name, counter, help_text in [("received", self.bytes_in, "Bytes received from Liveblog."),
+                                         ("sent", self.bytes_out, "Bytes sent to Liveblog.")]:
+            lines.append("# HELP {}_bytes_{}_total {}".format(prefix, name, help_text))
+            lines.append("# TYPE {}_bytes_{}_total counter".format(prefix, name))
+            for (endpoint, operation, status), value in sorted(counter.items()):
+                labels = self._labels(endpoint=endpoint, operation=operation, status=status)
+                lines.append("{}_bytes_{}_total{{{}}} {}".format(prefix, name, labels, value))
+        lines.append("# HELP {}_logins_total Logins at Liveblog.".format(prefix))
+        lines.append("# TYPE {}_logins_total counter".format(prefix))
+        for (endpoint, result), value in sorted(self.logins.items()):
+            lines.append("{}_logins_total{{{}}} {}".format(prefix, self._labels(endpoint=endpoint, result=result), value))
+        lines.append("# HELP {}_poll_bytes Bytes received per poll of a source.".format(prefix))
+        lines.append("# TYPE {}_poll_bytes summary".format(prefix))
+        for endpoint, value in sorted(self.polls.items()):
+            labels = self._labels(endpoint=endpoint)
+            lines.append("{}_poll_bytes_sum{{{}}} {}".format(prefix, labels, self.poll_bytes[endpoint]))
+            lines.append("{}_poll_bytes_count{{{}}} {}".format(prefix, labels, value))
+        lines.append("# HELP {}_poll_posts_total Posts received by polls.".format(prefix))
+        lines.append("# TYPE {}_poll_posts_total counter".format(prefix))
+        for endpoint, value in sorted(self.poll_posts.items()):
+            lines.append("{}_poll_posts_total{{{}}} {}".format(prefix, self._labels(endpoint=endpoint), value))
+        return "\n".join(lines) + "\n"
+
+
+# process-wide metrics of all Liveblog clients
+request_metrics = RequestMetrics()
+
+
+def to_prometheus():
+    """Returns the process-wide request metrics in Prometheus text format."""
+    return request_metrics.to_prometheus()
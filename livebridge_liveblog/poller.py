@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import logging
+import time
+from datetime import timezone
+
+logger = logging.getLogger(__name__)
+
+_pollers = {}
+
+
+def _utc(dt):
+    # cursors can be naive (utcnow) or aware (parsed from Liveblog)
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+
+
+def get_shared_poller(source, config):
+    """Returns the process-wide poller for the blog of **source**, creates it when needed.
+
+    :param source: subscribing source
+    :type source: livebridge_liveblog.LiveblogSource
+    :param config: config of the source, used for the poller's own unfiltered source
+    :returns: :class:`SharedPoller`"""
+    key = (source.endpoint, str(source.source_id))
+    if key not in _pollers:
+        # cursors are checkpointed by the subscribers
+        fetcher_conf = dict(config, filter_tags=None, shared_poll=False, checkpoint_path=None)
+        interval = float(config.get("shared_poll_interval", 10))
+        _pollers[key] = SharedPoller(key, type(source)(config=fetcher_conf), interval)
+    return _pollers[key]
+
+
+class SharedPoller(object):
+    """Polls the posts of one blog at most once per **interval** and hands the results \
+       to every subscribed :class:`livebridge_liveblog.LiveblogSource`.
+
+    The posts are fetched without tag filter, sources apply their *filter_tags* themselves."""
+
+    def __init__(self, key, fetcher, interval):
+        self.key = key
+        self.fetcher = fetcher
+        self.interval = interval
+        self._pending = {}
+        self._last_fetch = None
+        self._fetching = None
+
+    def __repr__(self):
+        return "<SharedPoller {}client_blogs/{} [{}]>".format(self.key[0], self.key[1], len(self._pending))
+
+    async def unsubscribe(self, source):
+        self._pending.pop(source, None)
+        if not self._pending:
+            if _pollers.get(self.key) is self:
+                del _pollers[self.key]
+            await self.fetcher.stop()
+
+    def _is_due(self):
+        return self._last_fetch is None or time.monotonic() - self._last_fetch >= self.interval
+
+    def _is_behind(self, source):
+        return self.fetcher.last_updated is None or \
+            _utc(source.last_updated) < _utc(self.fetcher.last_updated)
+
+    async def poll(self, source):
+        """Returns the posts fetched for **source** since its last call.
+
+        :param source: subscribing source
+        :type source: livebridge_liveblog.LiveblogSource
+        :returns: list of :class:`livebridge_liveblog.LiveblogPost`"""
+        if source not in self._pending:
+            self._pending[source] = []
+            # initialize cursor of new subscriber
+            await source._get_updated()
+
+        if self._is_due() or self._is_behind(source):
+            await self._fetch()
+            if self._is_behind(source):
+                # joined a fetch, which was started before subscribing
+                await self._fetch()
+
+        posts = self._pending.get(source, [])
+        self._pending[source] = []
+        return posts
+
+    async def _fetch(self):
+        if self._fetching is None:
+            self._fetching = asyncio.ensure_future(self._fetch_posts())
+            self._fetching.add_done_callback(self._reset_fetching)
+        await asyncio.shield(self._fetching)
+
+    def _reset_fetching(self, future):
+        if self._fetching is future:
+            self._fetching = None
+
+    async def _fetch_posts(self):
+        subscribers = list(self._pending)
+        # start at oldest cursor, subscribers skip posts they already got
+        self.fetcher.last_updated = min((s.last_updated for s in subscribers), key=_utc)
+        posts = await self.fetcher.poll()
+        self._last_fetch = time.monotonic()
+        cursor = _utc(self.fetcher.last_updated)
+
+        for source in subscribers:
+            if source not in self._pending:
+                continue
+            since = _utc(source.last_updated)
+            self._pending[source].extend(
+                p.copy() for p in posts
+                if _utc(p.updated) > since and source._match_filter_tags(p))
+            if cursor > since:
+                source.last_updated = self.fetcher.last_updated
+        logger.debug("{} fetched {} posts for {} sources".format(self, len(posts), len(subscribers)))
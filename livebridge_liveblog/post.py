@@ -15,62 +15,151 @@
 # limitations under the License.
 import asyncio
 import logging
-from dateutil.parser import parse as parse_date
+import re
+from datetime import datetime, timedelta, timezone
 from livebridge.base import BasePost
+from livebridge_liveblog.codec import get_json_codec
 
 logger = logging.getLogger(__name__)
 
+# timestamp format of Liveblog, e.g. 2016-04-28T11:24:22+00:00
+_TIMESTAMP_RE = re.compile(
+    r"^(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.(\d{1,6}))?(Z|[+-]\d{2}:?\d{2})$")
+
+
+def parse_timestamp(value):
+    """Parses ISO-8601 timestamps as sent by Liveblog, falls back to dateutil for other formats.
+
+    :param value: timestamp string
+    :returns: :py:class:`datetime.datetime`"""
+    match = _TIMESTAMP_RE.match(value) if isinstance(value, str) else None
+    if not match:
+        # dateutil is slow to import and rarely needed
+        from dateutil.parser import parse as parse_date
+        return parse_date(value)
+    year, month, day, hour, minute, second, fraction, offset = match.groups()
+    if offset == "Z":
+        tz = timezone.utc
+    else:
+        offset = offset.replace(":", "")
+        delta = timedelta(hours=int(offset[1:3]), minutes=int(offset[3:5]))
+        tz = timezone.utc if not delta else timezone(-delta if offset[0] == "-" else delta)
+    return datetime(int(year), int(month), int(day), int(hour), int(minute), int(second),
+                    int(fraction.ljust(6, "0")) if fraction else 0, tzinfo=tz)
+
+# fields read by the post itself, kept unpacked
+UNPACKED_FIELDS = ("_id", "blog", "_created", "_updated", "deleted", "published_date", "unpublished_date",
+               "lb_highlight", "highlight", "sticky", "post_status", "tags")
+_FIELD_POS = {key: pos for pos, key in enumerate(UNPACKED_FIELDS)}
+_MISSING = object()
+
+
 class LiveblogPost(BasePost):
+    """Post of a Liveblog.
+
+    Only the fields in :data:`UNPACKED_FIELDS` are kept as values, the rest of the post, \
+    mainly its *groups* with the items, is stored JSON encoded until :attr:`data` is accessed \
+    and replaced by the decoded post then."""
+
+    __slots__ = ["_values", "_payload", "_data", "_timestamps", "_deleted"]
 
     source = "liveblog"
 
+    def __init__(self, data, **kwargs):
+        self._timestamps = {}
+        self._deleted = None
+        super().__init__(data, **kwargs)
+
+    @property
+    def data(self):
+        """Complete post as dictionary, decoded on first access."""
+        if self._data is None:
+            data = get_json_codec().loads(self._payload)
+            for key, value in zip(UNPACKED_FIELDS, self._values):
+                if value is not _MISSING:
+                    data[key] = value
+            self._data = data
+            # copies of the shared poller hold their own reference to the payload
+            self._payload = None
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._values = tuple(data.get(key, _MISSING) for key in UNPACKED_FIELDS)
+        self._payload = get_json_codec().dumps({k: v for k, v in data.items() if k not in _FIELD_POS})
+        self._data = None
+
+    def copy(self):
+        """Returns a new post sharing the encoded data of this one."""
+        if self._data is not None:
+            return type(self)(self._data)
+        post = type(self)({})
+        post._values, post._payload = self._values, self._payload
+        return post
+
+    def _get(self, key, default=None):
+        if self._data is not None:
+            return self._data.get(key, default)
+        value = self._values[_FIELD_POS[key]]
+        return default if value is _MISSING else value
+
+    def _get_timestamp(self, key):
+        # parse only once, as long as the raw value doesn't change
+        value = self._get(key)
+        cached = self._timestamps.get(key)
+        if cached is None or cached[0] != value:
+            cached = (value, parse_timestamp(value))
+            self._timestamps[key] = cached
+        return cached[1]
+
     @property
     def id(self):
-       return self.data.get("_id")
+       return self._get("_id")
 
     @property
     def source_id(self):
-       return self.data.get("blog")
+       return self._get("blog")
+
+    @property
+    def tags(self):
+        return self._get("tags") or []
 
     @property
     def created(self):
-       return parse_date(self.data.get("_created"))
+       return self._get_timestamp("_created")
 
     @property
     def updated(self):
-       return parse_date(self.data.get("_updated"))
+       return self._get_timestamp("_updated")
 
     @property
     def is_update(self):
-       return (self.data["_created"] != self.data["_updated"])
+       return (self._get("_created") != self._get("_updated"))
 
     @property
     def is_deleted(self):
-        if hasattr(self, "_deleted"):
+        if self._deleted is not None:
+            # explicitly set state
             return self._deleted
-
-        self._deleted = self.data["deleted"]
-        if self.data.get("unpublished_date") and \
-            self.data["unpublished_date"] > self.data["published_date"]:
-            self._deleted = True
-        return self._deleted
+        unpublished = self._get("unpublished_date")
+        return bool(self._get("deleted") or (unpublished and unpublished > self._get("published_date")))
 
     @property
     def is_highlighted(self):
         # handle LB version 3.3+ and older ones
-        return self.data.get("lb_highlight", self.data.get("highlight", False))
+        return self._get("lb_highlight", self._get("highlight", False))
 
     @property
     def is_sticky(self):
-       return self.data.get("sticky", False)
+       return self._get("sticky", False)
 
     @property
     def is_submitted(self):
-       return bool(self.data.get("post_status") == "submitted")
+       return bool(self._get("post_status") == "submitted")
 
     @property
     def is_draft(self):
-       return bool(self.data.get("post_status") == "draft")
+       return bool(self._get("post_status") == "draft")
 
     def get_action(self):
         if (self.is_submitted == True or self.is_draft == True) and not self.is_known:
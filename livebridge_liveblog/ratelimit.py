@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# waiting requests with a lower value are sent first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+
+_rate_limiters = {}
+
+
+def get_rate_limiter(endpoint, *, rate=None, burst=10):
+    """Returns the rate limiter shared by all clients of the Liveblog instance at **endpoint**.
+
+    Without **rate**, the limiter of the endpoint is returned, if any client configured one. \
+    The limit of the first client applies, other values are logged as conflict.
+
+    :param endpoint: API endpoint of the Liveblog
+    :param rate: requests per second
+    :param burst: requests sent without delay after an idle period
+    :returns: :class:`RateLimiter` or None"""
+    limiter = _rate_limiters.get(endpoint)
+    if rate is None:
+        return limiter
+    if limiter is None:
+        limiter = _rate_limiters[endpoint] = RateLimiter(endpoint, rate=rate, burst=burst)
+    elif (limiter.rate, limiter.burst) != (float(rate), max(1, int(burst))):
+        logger.warning("Conflicting write rate {}/s, burst {} for {}, keeping {}/s, burst {}".format(
+            rate, burst, endpoint, limiter.rate, limiter.burst))
+    return limiter
+
+
+class RateLimiter(object):
+    """Token bucket, which lets at most **rate** requests per second through after a **burst**.
+
+    Requests beyond the limit wait in a queue, ordered by priority and arrival."""
+
+    def __init__(self, endpoint, *, rate, burst=10):
+        self.endpoint = endpoint
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self.tokens = float(self.burst)
+        self.waits = 0
+        self.wait_time = 0.0
+        self._updated = time.monotonic()
+        self._waiters = []
+        self._counter = itertools.count()
+        self._timer = None
+
+    def __repr__(self):
+        return "<RateLimiter {} [{}/s, {} waiting]>".format(self.endpoint, self.rate, len(self._waiters))
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, priority=PRIORITY_NORMAL):
+        """Returns as soon as a request with **priority** may be sent."""
+        self._refill()
+        if not self._waiters and self.tokens >= 1:
+            self.tokens -= 1
+            return
+        start = time.monotonic()
+        waiter = asyncio.get_event_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), waiter))
+        self._schedule()
+        # cancelled waiters are skipped on release
+        await waiter
+        self.waits += 1
+        self.wait_time += time.monotonic() - start
+        logger.debug("Request waited {:.3f}s for {}".format(time.monotonic() - start, self))
+
+    def _schedule(self):
+        if self._timer is None and self._waiters:
+            delay = max(0, (1 - self.tokens) / self.rate)
+            self._timer = asyncio.get_event_loop().call_later(delay, self._release)
+
+    def _release(self):
+        self._timer = None
+        self._refill()
+        while self._waiters and self.tokens >= 1:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if waiter.done():
+                continue
+            self.tokens -= 1
+            waiter.set_result(None)
+        self._schedule()
@@ -18,53 +18,149 @@ import asyncio
 import json
 import logging
 import re
+import time
+from collections import OrderedDict
 from datetime import datetime
 from os.path import join as path_join
 from urllib.parse import urlencode, urljoin
-from livebridge_liveblog.post import LiveblogPost
-from livebridge_liveblog.common import LiveblogClient
+from livebridge_liveblog.checkpoint import get_checkpoint_store
+from livebridge_liveblog.post import UNPACKED_FIELDS, LiveblogPost, parse_timestamp
+from livebridge_liveblog.common import LiveblogClient, comma_split
+from livebridge_liveblog.poller import get_shared_poller
 from livebridge.base import PollingSource
 
 logger = logging.getLogger(__name__)
 
+# blogs in these states are not polled
+CLOSED_STATUSES = ("closed", "archived")
+
+# fields of posts read by LiveblogPost and LiveblogLiveblogConverter
+POST_FIELDS = UNPACKED_FIELDS + (
+    "_etag", "groups.id", "groups.role", "groups.refs.type", "groups.refs.residRef", "groups.refs.item._id",
+    "groups.refs.item._etag", "groups.refs.item._updated", "groups.refs.item.item_type", "groups.refs.item.text",
+    "groups.refs.item.meta",
+)
+
 
 class LiveblogSource(LiveblogClient, PollingSource):
 
     type = "liveblog"
 
+    def __init__(self, *, config={}, **kwargs):
+        super().__init__(config=config, **kwargs)
+        self._page_size = max(1, int(config.get("page_size", 20)))
+        self._max_posts_per_poll = max(self._page_size, int(config.get("max_posts_per_poll", 200)))
+        self._shared_poller = get_shared_poller(self, config) if config.get("shared_poll") else None
+        self._adaptive_poll = config.get("adaptive_poll", False)
+        self._poll_backoff = float(config.get("poll_backoff", 10))
+        self._max_poll_interval = float(config.get("max_poll_interval", 300))
+        self._idle_polls = 0
+        self._next_poll = 0
+        post_fields = config.get("post_fields", POST_FIELDS)
+        if isinstance(post_fields, str):
+            post_fields = comma_split(post_fields)
+        self._post_fields = list(post_fields) if config.get("projection", False) else None
+        self._stream_posts = config.get("stream_posts", False)
+        self.last_poll_bytes = 0
+        checkpoint_path = config.get("checkpoint_path")
+        self._checkpoints = get_checkpoint_store(checkpoint_path) if checkpoint_path else None
+        # cursor of the posts returned by the last poll
+        self._delivered_updated = None
+
+    async def stop(self):
+        if self._shared_poller is not None:
+            await self._shared_poller.unsubscribe(self)
+        await super().stop()
+
+    def _match_filter_tags(self, post):
+        if not self.filter_tags:
+            return True
+        return bool(set(post.tags) & set(self.filter_tags))
+
     def _reset_source_meta(self):
         self._source_meta = {}
 
+    def _schedule_source_check(self, delay):
+        # only one pending check per source
+        if self._source_check_handler is not None:
+            self._source_check_handler.cancel()
+        self._source_check_handler = asyncio.get_event_loop().call_later(delay, self._reset_source_meta)
+
+    def _get_source_check_delay(self):
+        """Closed blogs are checked less often, the interval doubles up to *max_source_check_interval*."""
+        if self._source_status:
+            return self._source_check_interval
+        return min(self._max_source_check_interval,
+                   self._source_check_interval * 2 ** min(self._closed_checks - 1, 32))
+
+    @property
+    def _source_meta_url(self):
+        return "{}/{}".format(self.endpoint, path_join("client_blogs", str(self.source_id)))
+
+    async def _suspend(self):
+        """Releases cached responses and pooled connections of a closed blog.
+
+        The response of the blog itself is kept, status checks of the closed blog stay conditional."""
+        meta_key = self._get_validator_key(self._source_meta_url)
+        for key in list(self._validators):
+            if key != meta_key:
+                self._validators.pop(key)
+        if self._session:
+            await self._session.close()
+            self._session = None
+
     async def _is_source_open(self):
         if not self._source_meta:
+            source_meta = await self._get(self._source_meta_url)
+            if source_meta:
+                # handle state
+                blog_status = source_meta.get("blog_status")
+                is_open = blog_status not in CLOSED_STATUSES
+                if is_open != self._source_status:
+                    logger.info("Liveblog status for {} changed to [{}]".format(self.source_id, blog_status))
+                    if is_open:
+                        # poll reopened blog right away
+                        self._next_poll = 0
+                    else:
+                        await self._suspend()
+                self._closed_checks = 0 if is_open else self._closed_checks + 1
+                self._source_status = is_open
+                self._source_meta = source_meta
             # schedule reset of _source_meta to force refetch
-            self._source_check_handler = asyncio.get_event_loop().call_later(
-                self._source_check_interval, self._reset_source_meta)
-
-            url = "{}/{}".format(self.endpoint, path_join("client_blogs", str(self.source_id)))
-            self._source_meta = await self._get(url)
-
-            # handle state
-            blog_status = self._source_meta.get("blog_status")
-            is_open = False if blog_status == "closed" else True
-            if is_open != self._source_status:
-                logger.info("Liveblog status for {} changed to [{}]".format(self.source_id, blog_status))
-            self._source_status = is_open
+            self._schedule_source_check(self._get_source_check_delay())
         return self._source_status
 
+    @property
+    def _checkpoint_key(self):
+        key = "{}/client_blogs/{}".format(self.endpoint, self.source_id)
+        if self.filter_tags:
+            key += "?tags={}".format(",".join(self.filter_tags))
+        return key
+
+    def _save_checkpoint(self):
+        """Stores the cursor of the posts returned by the previous poll, which are handled by now."""
+        if self._checkpoints is not None and self._delivered_updated is not None:
+            self._checkpoints.set(self._checkpoint_key, self._delivered_updated)
+
     async def _get_updated(self):
+        if not self.last_updated and self._checkpoints is not None:
+            self.last_updated = self._checkpoints.get(self._checkpoint_key)
+
         if not self.last_updated:
             self.last_updated = await self.get_last_updated(self.source_id)
 
         if not self.last_updated:
+            logger.warning("No last updated timestamp for {}, starting from now.".format(self.source_id))
             self.last_updated = datetime.utcnow()
 
         return {"gt": datetime.strftime(self.last_updated, "%Y-%m-%dT%H:%M:%S+00:00")}
 
-    async def _get_posts_params(self):
-        # define "updated" filter param
-        updated = await self._get_updated()
-
+    async def _get_posts_params(self, page=1, since=None):
+        # define "updated" filter param, pages of a catch-up start at the last post of the previous one
+        if since is not None:
+            updated = {"gte": datetime.strftime(since, "%Y-%m-%dT%H:%M:%S+00:00")}
+        else:
+            updated = await self._get_updated()
 
         # build query param
         source = {"query": {
@@ -90,28 +186,143 @@ class LiveblogSource(LiveblogClient, PollingSource):
             tags = self.filter_tags
             logger.info("Filtering input "+ str(self.source_id) + " for tags: "+ repr(tags))
             source["post_filter"] = { "terms" : { "tags" : tags }}
+
+        # request only the fields of posts which are processed
+        if self._post_fields:
+            source["_source"] = {"includes": self._post_fields}
         return urlencode([
-            ("max_results", 20),
-            ("page", 1),
+            ("max_results", self._page_size),
+            ("page", page),
             ("source", json.dumps(source))
         ])
 
-    async def _get_posts_url(self):
-        params = await self._get_posts_params()
+    async def _get_posts_url(self, page=1, since=None):
+        params = await self._get_posts_params(page, since)
         url = "{}/{}?{}".format(self.endpoint, path_join("client_blogs", str(self.source_id), "posts"), params)
         return url
 
+    async def _fetch_page(self, page, since=None):
+        url = await self._get_posts_url(page, since)
+        return await self._get(url)
+
+    def _next_page(self, page, since, last_updated):
+        """Returns *page* and *since* of the request following a full page ending with **last_updated**.
+
+        Paging by number alone skips a post, when a post of an earlier page is edited \
+        and moves to the end. Only a page with a single timestamp is continued by number."""
+        last_updated = parse_timestamp(last_updated)
+        if since is not None and last_updated <= since:
+            return page + 1, since
+        return 1, last_updated
+
+    def _add_post(self, posts, item):
+        """Adds **item** to **posts**, returns False when it was there already."""
+        post = LiveblogPost(item)
+        known = posts.get(post.id)
+        if known is not None and known.updated == post.updated:
+            # refetched at the cursor of the next page
+            return False
+        # keep latest version when a post moved between pages
+        posts.pop(post.id, None)
+        posts[post.id] = post
+        return True
+
+    async def _fetch_posts(self):
+        """Fetches pages of posts until a page is not full or *max_posts_per_poll* is reached.
+
+        The next page is requested ahead, while the current one is processed. \
+        Returns None, when no posts were received because a request failed."""
+        posts = OrderedDict()
+        failed = False
+        page, since = 1, None
+        next_page = asyncio.ensure_future(self._fetch_page(page, since))
+        while next_page is not None:
+            res = await next_page
+            # failed requests return no response at all
+            failed = "_items" not in res
+            items = res.get("_items", [])
+            next_page = None
+            if len(items) >= self._page_size and len(posts) + len(items) < self._max_posts_per_poll:
+                page, since = self._next_page(page, since, items[-1]["_updated"])
+                next_page = asyncio.ensure_future(self._fetch_page(page, since))
+                logger.info("Catching up {}, fetching page {} since {}".format(self.source_id, page, since))
+            for item in items:
+                self._add_post(posts, item)
+        return None if failed and not posts else list(posts.values())
+
+    async def _stream_posts_pages(self):
+        """Like :meth:`_fetch_posts`, but parses the posts of a page one at a time while it is received.
+
+        Pages are requested one after another, the cursor of the next page is known \
+        only when the current one is complete."""
+        posts = OrderedDict()
+        page, since = 1, None
+        while True:
+            page_ids = set()
+            last_updated = None
+
+            def add_post(item):
+                nonlocal last_updated
+                page_ids.add(item["_id"])
+                last_updated = item["_updated"]
+                self._add_post(posts, item)
+
+            url = await self._get_posts_url(page, since)
+            if await self._get_stream(url, "_items", add_post) is None:
+                return list(posts.values()) if posts else None
+            # counted by id, a retried request passes the same items again
+            if len(page_ids) < self._page_size or len(posts) >= self._max_posts_per_poll:
+                break
+            page, since = self._next_page(page, since, last_updated)
+            logger.info("Catching up {}, fetching page {} since {}".format(self.source_id, page, since))
+        return list(posts.values())
+
+    def _is_poll_due(self):
+        return not self._adaptive_poll or time.monotonic() >= self._next_poll
+
+    def _schedule_next_poll(self, posts):
+        """With *adaptive_poll*, idle blogs are skipped for a growing delay, active ones polled on every call.
+
+        A failed poll, **posts** is None, doesn't grow the delay, the blog is polled again on the next call."""
+        if not self._adaptive_poll:
+            return
+        if posts is None:
+            self._next_poll = 0
+            return
+        if posts:
+            self._idle_polls = 0
+            self._next_poll = 0
+            return
+        self._idle_polls += 1
+        delay = min(self._max_poll_interval, self._poll_backoff * 2 ** min(self._idle_polls - 1, 32))
+        self._next_poll = time.monotonic() + delay
+        logger.debug("No new posts for {}, next poll in {}s".format(self.source_id, delay))
+
     async def poll(self):
+        self._save_checkpoint()
+
+        if self._shared_poller is not None:
+            posts = await self._shared_poller.poll(self)
+            self._delivered_updated = self.last_updated
+            return posts
+
+        if not self._is_poll_due():
+            return []
+
         if not await self._is_source_open():
             return []
 
-        url = await self._get_posts_url()
-        res = await self._get(url)
-        posts = [LiveblogPost(p) for p in res.get("_items",[])]
+        bytes_received = self.bytes_received
+        posts = await (self._stream_posts_pages() if self._stream_posts else self._fetch_posts())
+        self._schedule_next_poll(posts)
+        posts = posts or []
+        self.last_poll_bytes = self.bytes_received - bytes_received
+        if self._metrics is not None:
+            self._metrics.observe_poll(self.endpoint, self.last_poll_bytes, len(posts))
 
         # remember updated timestamp
         for p in posts:
             self.last_updated = p.updated
+        self._delivered_updated = self.last_updated
 
         return posts
-
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import codecs
+import json
+from json.decoder import WHITESPACE
+
+
+class JSONItemStream(object):
+    """Incremental parser of a JSON object, which is fed with chunks of the response body.
+
+    Every element of the list under **key** is passed to **callback** as soon as it is complete, \
+    so only a single item is held in memory. All other members are collected in :attr:`meta`.
+    The elements are decoded with :class:`json.JSONDecoder`, which can parse from an offset."""
+
+    def __init__(self, key, callback):
+        self.key = key
+        self.callback = callback
+        self.meta = {}
+        self.count = 0
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._state = "start"
+        self._member = None
+        self._closed = False
+        # a failed decode is retried when the pending data has doubled
+        self._retry_size = 0
+
+    def feed(self, chunk):
+        self._buf += self._text.decode(chunk)
+        self._parse()
+
+    def close(self):
+        """Parses the remaining data, raises :exc:`ValueError` if the document is incomplete."""
+        self._buf += self._text.decode(b"", final=True)
+        self._closed = True
+        self._retry_size = 0
+        self._parse()
+        if self._state != "done":
+            raise ValueError("Incomplete JSON document, expected {}".format(self._state))
+
+    def _decode(self, pos):
+        """Returns the value at **pos** and the position after it, None when more data is needed."""
+        pending = len(self._buf) - pos
+        if pending < self._retry_size:
+            return None
+        try:
+            value, end = self._decoder.raw_decode(self._buf, pos)
+        except ValueError:
+            if self._closed:
+                raise
+            self._retry_size = pending * 2
+            return None
+        if end == len(self._buf) and not self._closed and isinstance(value, (int, float)):
+            # number might continue in the next chunk
+            return None
+        self._retry_size = 0
+        return value, end
+
+    def _parse(self):
+        buf = self._buf
+        pos = 0
+        while True:
+            pos = WHITESPACE.match(buf, pos).end()
+            if pos == len(buf) or self._state == "done":
+                break
+            char = buf[pos]
+            state = self._state
+            if state == "start":
+                self._expect(char, "{")
+                pos += 1
+                self._state = "key"
+            elif state in ("key", "next_key") and char == "}":
+                pos += 1
+                self._state = "done"
+            elif state in ("key", "first_key"):
+                res = self._decode(pos)
+                if res is None:
+                    break
+                self._member, pos = res
+                self._state = "colon"
+            elif state == "colon":
+                self._expect(char, ":")
+                pos += 1
+                self._state = "items" if self._member == self.key else "value"
+            elif state == "value":
+                res = self._decode(pos)
+                if res is None:
+                    break
+                self.meta[self._member], pos = res
+                self._state = "next_key"
+            elif state == "next_key":
+                self._expect(char, ",")
+                pos += 1
+                self._state = "first_key"
+            elif state == "items":
+                self._expect(char, "[")
+                pos += 1
+                self._state = "item"
+            elif state in ("item", "next_item") and char == "]":
+                pos += 1
+                self._state = "next_key"
+            elif state == "next_item":
+                self._expect(char, ",")
+                pos += 1
+                self._state = "first_item"
+            elif state in ("item", "first_item"):
+                res = self._decode(pos)
+                if res is None:
+                    break
+                item, pos = res
+                self._state = "next_item"
+                self.count += 1
+                self.callback(item)
+        # drop parsed data
+        self._buf = buf[pos:]
+
+    def _expect(self, char, expected):
+        if char != expected:
+            raise ValueError("Invalid JSON document, expected {!r} in state {}, got {!r}".format(
+                expected, self._state, char))
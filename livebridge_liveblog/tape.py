@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import base64
+import gzip
+import json
+import logging
+import time
+from collections import defaultdict, deque
+from livebridge_liveblog.metrics import get_operation
+
+logger = logging.getLogger(__name__)
+
+TAPE_MODES = ("record", "replay")
+
+# response headers kept on the tape
+TAPE_HEADERS = ("ETag", "Last-Modified", "Content-Type")
+
+# response of redacted requests, replayed logins get a token which is never checked
+REDACTED_RESPONSE = b'{"token": "redacted"}'
+
+_tapes = {}
+
+
+def get_tape(path, mode, *, speed=1):
+    """Returns the tape at **path** shared by all clients of the process, opens it when needed.
+
+    :param path: tape file, gzip compressed when it ends with ``.gz``
+    :param mode: ``record`` or ``replay``
+    :param speed: replay speed, 1 is the original timing, 0 replays without delays
+    :returns: :class:`TapeRecorder` or :class:`TapePlayer`"""
+    if mode not in TAPE_MODES:
+        raise ValueError("Invalid tape mode {!r}, expected one of {}".format(mode, TAPE_MODES))
+    if path not in _tapes:
+        _tapes[path] = TapeRecorder(path) if mode == "record" else TapePlayer(path, speed=speed)
+    return _tapes[path]
+
+
+def acquire_tape(path, mode, *, speed=1):
+    """Like :func:`get_tape`, but counts the client using the tape, see :func:`release_tape`."""
+    tape = get_tape(path, mode, speed=speed)
+    tape.clients += 1
+    return tape
+
+
+def release_tape(tape):
+    """Called by a stopped client, the tape is closed when its last client released it.
+
+    :param tape: :class:`TapeRecorder` or :class:`TapePlayer` returned by :func:`acquire_tape`"""
+    tape.clients -= 1
+    if tape.clients > 0:
+        return
+    if _tapes.get(tape.path) is tape:
+        del _tapes[tape.path]
+    tape.close()
+
+
+def _open(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def _encode(content):
+    if not content:
+        return {}
+    try:
+        return {"body": content.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"body_b64": base64.b64encode(content).decode("ascii")}
+
+
+def _decode(entry):
+    if "body_b64" in entry:
+        return base64.b64decode(entry["body_b64"])
+    return entry.get("body", "").encode("utf-8")
+
+
+class TapeRecorder(object):
+    """Writes requests and responses of Liveblog clients as JSON lines to **path**.
+
+    Every line holds the offset since the start of the recording, the duration, method, \
+    path below the endpoint, status, some headers and the bodies of a request."""
+
+    mode = "record"
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = 0
+        self.clients = 0
+        self._start = time.monotonic()
+        self._file = _open(path, "w")
+
+    def record(self, endpoint, method, url, status, headers, content, *, duration, body=None, redact=False):
+        """Appends a request to the tape, with **redact** its bodies are left out, e.g. for logins."""
+        if redact:
+            body, content = None, REDACTED_RESPONSE
+        entry = {
+            "t": round(time.monotonic() - duration - self._start, 6),
+            "duration": round(duration, 6),
+            "method": method,
+            "path": url[len(endpoint):] if url.startswith(endpoint) else url,
+            "status": status,
+            "headers": {k: headers[k] for k in TAPE_HEADERS if k in headers},
+        }
+        entry.update(_encode(content))
+        if isinstance(body, (bytes, str)) and body:
+            request = _encode(body if isinstance(body, bytes) else body.encode("utf-8"))
+            entry.update({"request_" + k: v for k, v in request.items()})
+        self._file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        # readable up to the last request, also when the process gets killed
+        self._file.flush()
+        self.entries += 1
+
+    def close(self):
+        self._file.close()
+
+
+class TapePlayer(object):
+    """Answers requests of Liveblog clients with the responses recorded on the tape at **path**.
+
+    Requests get the next unused response recorded for the same method and path, otherwise \
+    for the same operation, e.g. polls with a different *last_updated*. Each response is \
+    delayed to its recorded time since the first replayed request, divided by **speed**."""
+
+    mode = "replay"
+
+    def __init__(self, path, *, speed=1):
+        self.path = path
+        self.speed = float(speed)
+        self.missing = 0
+        self.clients = 0
+        self._start = None
+        self._by_path = defaultdict(deque)
+        self._by_operation = defaultdict(deque)
+        self._load()
+
+    def __len__(self):
+        return self.pending()
+
+    def pending(self, operation=None):
+        """Returns the number of unused responses, of all or of **operation** like ``GET client_blogs/{id}``."""
+        queues = [self._by_operation[operation]] if operation else self._by_operation.values()
+        return sum(not entry["used"] for queue in queues for entry in queue)
+
+    def close(self):
+        pass
+
+    def _load(self):
+        entries = 0
+        with _open(self.path, "r") as f:
+            try:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        logger.warning("Skipping invalid line in tape {}".format(self.path))
+                        continue
+                    entry["used"] = False
+                    self._by_path[(entry["method"], entry["path"])].append(entry)
+                    self._by_operation[get_operation("", entry["method"], entry["path"])].append(entry)
+                    entries += 1
+            except EOFError:
+                # compressed tape of an interrupted recording
+                logger.warning("Tape {} ends unexpectedly".format(self.path))
+        logger.info("Loaded {} requests from tape {}".format(entries, self.path))
+
+    @staticmethod
+    def _next(queue):
+        while queue and queue[0]["used"]:
+            queue.popleft()
+        return queue.popleft() if queue else None
+
+    async def play(self, endpoint, method, url):
+        """Returns status, headers and body of the recorded response."""
+        path = url[len(endpoint):] if url.startswith(endpoint) else url
+        entry = self._next(self._by_path[(method, path)]) or \
+            self._next(self._by_operation[get_operation("", method, path)])
+        if entry is None:
+            self.missing += 1
+            logger.warning("No response on tape for {} {}".format(method.upper(), path))
+            return 404, {}, b""
+        entry["used"] = True
+        now = time.monotonic()
+        if self._start is None:
+            self._start = now - entry["t"] / self.speed if self.speed else now
+        if self.speed:
+            delay = self._start + (entry["t"] + entry["duration"]) / self.speed - now
+            if delay > 0:
+                await asyncio.sleep(delay)
+        return entry["status"], entry["headers"], _decode(entry)
@@ -14,20 +14,67 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import aiohttp
+import asyncio
+import hashlib
 import logging
 import json
+import time
 from urllib.parse import quote_plus
 from livebridge.base import BaseTarget, TargetResponse, InvalidTargetResource
+from livebridge_liveblog.cache import file_digest, get_image_cache
 from livebridge_liveblog.common import LiveblogClient
 
 
 logger = logging.getLogger(__name__)
 
+# key in the target doc, listing content hash and guid of every item of the post
+ITEMS_KEY = "_livebridge_items"
+
+
+class _PostUpdates(object):
+    """Updates of one post at the target, which are coalesced into one PATCH per *update_window*."""
+
+    def __init__(self):
+        # last response of the target
+        self.doc = None
+        self.last_patch = 0
+        # latest update, which is not sent yet
+        self.post = None
+        self.items = None
+        self.hashes = None
+        self.first_pending = 0
+        # failed attempts to send the held back update
+        self.failures = 0
+        self.handle = None
+        self.lock = asyncio.Lock()
+
+    def cancel(self):
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+
 
 class LiveblogTarget(LiveblogClient, BaseTarget):
 
     type = "liveblog"
 
+    def __init__(self, *, config={}, **kwargs):
+        super().__init__(config=config, **kwargs)
+        self._item_concurrency = max(1, int(config.get("item_concurrency", 4)))
+        image_cache_size = int(config.get("image_cache_size", 1000))
+        self._image_cache = get_image_cache(
+            self.endpoint, size=image_cache_size, path=config.get("image_cache_path")) if image_cache_size else None
+        self._update_window = float(config.get("update_window", 0))
+        self._max_update_delay = float(config.get("max_update_delay", 10))
+        self._update_retries = max(0, int(config.get("update_retries", 3)))
+        self._updates = {}
+
+    async def stop(self):
+        # send held back updates, no retries
+        for id_at_target, updates in list(self._updates.items()):
+            await self._flush_update(id_at_target, updates, retry=False)
+        await super().stop()
+
     def get_id_at_target(self, post):
         """Extracts id from the given **post** of the target resource.
 
@@ -121,29 +168,92 @@ class LiveblogTarget(LiveblogClient, BaseTarget):
         # save item in target blog
         data["blog"] = self.target_id
         url = "{}/{}".format(self.endpoint, "items")
-        item = await self._post(url, json.dumps(data), status=201)
+        item = await self._post(url, self._json.dumps(data), status=201)
         return item
 
+    async def _save_items(self, content):
+        """Saves the **content** items concurrently, at most *item_concurrency* at once.
+
+        :param content: converted items of a post
+        :type content: list
+        :returns: list of saved items, in the order of **content**"""
+        semaphore = asyncio.Semaphore(self._item_concurrency)
+
+        async def save(item):
+            async with semaphore:
+                return await self._save_item(item)
+
+        items = await asyncio.gather(*[save(item) for item in content], return_exceptions=True)
+        failed = [(pos, item) for pos, item in enumerate(items)
+                  if isinstance(item, Exception) or not item or not item.get("guid")]
+        if failed:
+            for pos, item in failed:
+                logger.error("Saving item {} of post failed for [{}] - {}".format(pos, self, item))
+            raise Exception("{} of {} items could not be saved at [{}]!".format(len(failed), len(items), self))
+        return items
+
+    def _get_item_hash(self, item):
+        # local path of downloaded images differs per conversion
+        data = {k: v for k, v in item.items() if k not in ("tmp_path", "blog")}
+        return hashlib.sha1(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _get_known_items(self, post):
+        """Returns guids of the items saved for **post** at the target, grouped by content hash."""
+        known = {}
+        target_doc = post.target_doc or {}
+        for entry in target_doc.get(ITEMS_KEY, []):
+            known.setdefault(entry["hash"], []).append(entry["guid"])
+        return known
+
+    async def _sync_items(self, post, known=None):
+        """Saves only new or changed items of **post**, items with a hash in **known** reuse their guid.
+
+        :returns: tuple of saved items and list of their content hashes"""
+        known = known or {}
+        hashes = [self._get_item_hash(item) for item in post.content]
+        items = [None] * len(hashes)
+        for pos, item_hash in enumerate(hashes):
+            if known.get(item_hash):
+                items[pos] = {"guid": known[item_hash].pop(0)}
+        missing = [pos for pos, item in enumerate(items) if item is None]
+        if missing:
+            saved = await self._save_items([post.content[pos] for pos in missing])
+            for pos, item in zip(missing, saved):
+                items[pos] = item
+        logger.debug("Reused {} of {} items for [{}]".format(len(items) - len(missing), len(items), self))
+        return items, hashes
+
+    def _build_response(self, resp, items, hashes):
+        if resp:
+            resp[ITEMS_KEY] = [{"hash": h, "guid": item["guid"]} for h, item in zip(hashes, items)]
+        return TargetResponse(resp)
+
     async def _save_image(self, img_item):
         new_img = None
         try:
+            digest = file_digest(img_item["tmp_path"]) if self._image_cache is not None else None
+            if digest:
+                new_img = self._image_cache.get(digest)
+                if new_img:
+                    logger.debug("Reusing archived image {} for [{}]".format(new_img.get("_id"), self))
+                    return new_img
             # upload photo to liveblog instance
             url = "{}/{}".format(self.endpoint, "archive")
-            # build form data
-            data = aiohttp.FormData()
-            data.add_field('media',
-               open(img_item["tmp_path"], 'rb'),
-               content_type='image/jpg')
-            # send data
-            connector = aiohttp.TCPConnector(ssl=False)
-            headers = self._get_auth_header()
-            session = aiohttp.ClientSession(connector=connector, headers=headers, conn_timeout=10)
-            async with session.post(url, data=data) as r:
-                if r.status == 201:
-                    new_img = await r.json()
-                else:
-                    raise Exception("Image{} could not be saved!".format(img_item))
-            await session.close()
+            with open(img_item["tmp_path"], 'rb') as img_file:
+                def form_data():
+                    # build form data, new one for every attempt
+                    img_file.seek(0)
+                    data = aiohttp.FormData()
+                    data.add_field('media', img_file, content_type='image/jpg')
+                    return data
+                # send data via pooled session of the client
+                status, _, content = await self._request("post", url, data=form_data)
+            if status == 201:
+                new_img = self._json.loads(content)
+                if digest:
+                    self._image_cache.set(digest, new_img)
+            else:
+                raise Exception("Image{} could not be saved!".format(img_item))
         except Exception as e:
             logger.error("Posting image failed for [{}] - {}".format(self, img_item))
             logger.exception(e)
@@ -151,43 +261,158 @@ class LiveblogTarget(LiveblogClient, BaseTarget):
 
     async def post_item(self, post):
         """Build your request to create a post."""
-        await self._login()
+        await self._ensure_login()
         # save item parts
-        items = []
-        for item in post.content:
-            items.append(await self._save_item(item))
+        items, hashes = await self._sync_items(post)
         # save new post
         data = self._build_post_data(post, items)
         url = "{}/{}".format(self.endpoint, "posts")
-        return TargetResponse(await self._post(url, json.dumps(data), status=201))
+        return self._build_response(await self._post(url, self._json.dumps(data), status=201), items, hashes)
 
     async def update_item(self, post):
         """Build your request to update a post."""
-        await self._login()
-        # save item parts
-        items = []
-        for item in post.content:
-            items.append(await self._save_item(item))
-        data = self._build_post_data(post, items)
+        await self._ensure_login()
         # get id of post at target
         id_at_target = self.get_id_at_target(post)
         if not id_at_target:
             raise InvalidTargetResource("No id for resource at target found!")
+        if self._update_window > 0:
+            return await self._coalesce_update(id_at_target, post)
+        # save new or changed item parts only
+        items, hashes = await self._sync_items(post, self._get_known_items(post))
+        return await self._patch_post(id_at_target, post, items, hashes)
+
+    async def _patch_post(self, id_at_target, post, items, hashes):
+        data = self._build_post_data(post, items)
         # patch existing post
         url = "{}/{}/{}".format(self.endpoint, "posts", id_at_target)
-        return TargetResponse(await self._patch(url, json.dumps(data), etag=self.get_etag_at_target(post)))
+        resp = await self._patch(url, self._json.dumps(data), etag=self.get_etag_at_target(post))
+        return self._build_response(resp, items, hashes)
+
+    def _get_post_updates(self, id_at_target):
+        updates = self._updates.get(id_at_target)
+        if updates is None:
+            # forget posts without recent or pending updates
+            expired = time.monotonic() - self._update_window
+            for key, other in list(self._updates.items()):
+                if other.post is None and other.last_patch < expired and not other.lock.locked():
+                    del self._updates[key]
+            updates = self._updates[id_at_target] = _PostUpdates()
+        return updates
+
+    def _get_current_doc(self, post, updates):
+        """Returns the target doc of **post** including a held back update."""
+        doc = updates.doc if updates.doc is not None else post.target_doc
+        if updates.post is not None:
+            doc = self._build_response(dict(doc or {}), updates.items, updates.hashes)
+        return doc
+
+    async def _coalesce_update(self, id_at_target, post):
+        """Sends the update of **post** right away, if the post wasn't patched within *update_window*.
+
+        Otherwise its items are saved and the PATCH is held back, until no further update arrived \
+        for *update_window* seconds or at most *max_update_delay* seconds. Only the latest of the \
+        held back updates is sent. The returned doc has the etag of the last PATCH."""
+        updates = self._get_post_updates(id_at_target)
+        post.target_doc = self._get_current_doc(post, updates)
+        items, hashes = await self._sync_items(post, self._get_known_items(post))
+        now = time.monotonic()
+        if updates.post is None and now - updates.last_patch >= self._update_window:
+            async with updates.lock:
+                post.target_doc = self._get_current_doc(post, updates)
+                resp = await self._patch_post(id_at_target, post, items, hashes)
+                updates.last_patch = time.monotonic()
+                if resp:
+                    updates.doc = resp
+            return resp
+
+        if updates.post is None:
+            updates.first_pending = now
+        updates.post, updates.items, updates.hashes = post, items, hashes
+        delay = max(0, min(self._update_window, updates.first_pending + self._max_update_delay - now))
+        self._schedule_flush(id_at_target, updates, delay)
+        logger.debug("Holding back update of {} for {}s [{}]".format(post.id, delay, self))
+        return self._get_current_doc(post, updates)
+
+    def _schedule_flush(self, id_at_target, updates, delay):
+        updates.cancel()
+        updates.handle = asyncio.get_event_loop().call_later(
+            delay, lambda: asyncio.ensure_future(self._flush_update(id_at_target, updates)))
+
+    async def _flush_update(self, id_at_target, updates, *, retry=True):
+        """Sends the held back update of a post and stores the response for livebridge.
+
+        A failed update is retried up to *update_retries* times with backoff. Afterwards \
+        the last confirmed doc is stored, livebridge got the doc of the update already."""
+        async with updates.lock:
+            updates.cancel()
+            post = updates.post
+            if post is None:
+                return
+            items, hashes = updates.items, updates.hashes
+            updates.post = updates.items = updates.hashes = None
+            post.target_doc = updates.doc if updates.doc is not None else post.target_doc
+            resp = None
+            try:
+                resp = await self._patch_post(id_at_target, post, items, hashes)
+            except InvalidTargetResource as e:
+                # edited at the target, sending it again fails the same way
+                logger.error("Held back update of {} rejected [{}] - {}".format(post.id, self, e))
+                retry = False
+            except Exception as e:
+                logger.exception(e)
+            finally:
+                updates.last_patch = time.monotonic()
+            if resp:
+                updates.failures = 0
+                updates.doc = resp
+                await self._store_target_doc(post, resp.data)
+                return
+            updates.failures += 1
+            if updates.post is not None:
+                # a newer update is held back already and replaces this one
+                return
+            if retry and updates.failures <= self._update_retries:
+                updates.post, updates.items, updates.hashes = post, items, hashes
+                delay = max(self._update_window, self._get_retry_delay(updates.failures))
+                self._schedule_flush(id_at_target, updates, delay)
+                logger.warning("Held back update of {} failed, retrying in {:.1f}s [{}]".format(post.id, delay, self))
+                return
+            logger.error("Held back update of {} failed [{}]".format(post.id, self))
+            updates.failures = 0
+            # stored doc has to match the target again, the next update of the post is sent in full
+            await self._store_target_doc(post, post.target_doc)
+
+    async def _store_target_doc(self, post, target_doc):
+        try:
+            # livebridge stored the doc returned before the PATCH
+            await self._db.update_post(
+                target_id=self.target_id, post_id=post.id, source_id=post.source_id, text=str(post.content),
+                sticky=post.is_sticky, created=post.created, updated=post.updated,
+                target_doc=getattr(target_doc, "data", target_doc))
+        except Exception as e:
+            logger.error("Storing held back update of {} failed [{}]".format(post.id, self))
+            logger.exception(e)
 
     async def delete_item(self, post):
         """Build your request to delete a post."""
-        await self._login()
+        await self._ensure_login()
         # get id of post at target
         id_at_target = self.get_id_at_target(post)
         if not id_at_target:
             raise InvalidTargetResource("No id for resource at target found!")
+        updates = self._updates.pop(id_at_target, None)
+        if updates is not None:
+            # drop held back update, use etag of last PATCH
+            async with updates.lock:
+                updates.cancel()
+                updates.post = None
+                if updates.doc is not None:
+                    post.target_doc = updates.doc
         # delete post
         url = "{}/{}/{}".format(self.endpoint, "posts", id_at_target)
         data = {"deleted": True, "post_status": "open"}
-        return TargetResponse(await self._patch(url, json.dumps(data), etag=self.get_etag_at_target(post)))
+        return TargetResponse(await self._patch(url, self._json.dumps(data), etag=self.get_etag_at_target(post)))
 
     async def handle_extras(self, post):
         return None
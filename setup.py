@@ -41,9 +41,13 @@ See https://github.com/dpa-newslab/livebridge-liveblog for more infos.
       maintainer_email='martin@borho.net',
       url='https://github.com/dpa-newslab/livebridge-scribblelive',
       license='Apache Software License (http://www.apache.org/licenses/LICENSE-2.0)',
-      packages=find_packages(exclude=['tests', 'htmlcov']),
+      packages=find_packages(exclude=['tests', 'htmlcov', 'benchmarks']),
       include_package_data=True,
       zip_safe=False,
       install_requires=[
         "livebridge>=0.26.0"
-      ])
+      ],
+      extras_require={
+        "orjson": ["orjson"],
+        "ujson": ["ujson"],
+      })
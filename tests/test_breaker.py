@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from unittest import mock
+from livebridge_liveblog.breaker import CircuitBreaker, get_circuit_breaker, _breakers
+
+
+def test_get_circuit_breaker():
+    _breakers.clear()
+    breaker = get_circuit_breaker("https://example.com/api", threshold=3, reset_timeout=10)
+    assert breaker is get_circuit_breaker("https://example.com/api")
+    with mock.patch("livebridge_liveblog.breaker.logger") as logger:
+        assert breaker is get_circuit_breaker("https://example.com/api", threshold=3, reset_timeout=10)
+        assert logger.warning.call_count == 0
+        # settings of the first client apply, conflicting ones are logged
+        assert breaker is get_circuit_breaker("https://example.com/api", threshold=5, reset_timeout=10)
+        assert logger.warning.call_count == 1
+    assert breaker is not get_circuit_breaker("https://example.org/api")
+    assert breaker.threshold == 3
+    assert breaker.reset_timeout == 10
+    assert get_circuit_breaker("https://example.org/api").threshold == 5
+    _breakers.clear()
+
+
+@mock.patch("livebridge_liveblog.breaker.time.monotonic")
+def test_circuit_breaker(monotonic):
+    monotonic.return_value = 100
+    breaker = CircuitBreaker("https://example.com/api", threshold=3, reset_timeout=10)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.allow() is True
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow() is False
+
+    # one trial request after the timeout, its failure opens the circuit again
+    monotonic.return_value = 110
+    assert breaker.allow() is True
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow() is False
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.allow() is False
+
+    # successful trial closes it
+    monotonic.return_value = 120
+    assert breaker.allow() is True
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
+    assert breaker.allow() is True
+
+
+@mock.patch("livebridge_liveblog.breaker.time.monotonic")
+def test_circuit_breaker_lost_trial(monotonic):
+    monotonic.return_value = 100
+    breaker = CircuitBreaker("https://example.com/api", threshold=1, reset_timeout=10)
+    breaker.record_failure()
+    monotonic.return_value = 110
+    assert breaker.allow() is True
+    # trial request never reported back
+    monotonic.return_value = 119
+    assert breaker.allow() is False
+    monotonic.return_value = 120
+    assert breaker.allow() is True
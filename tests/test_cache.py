@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import hashlib
+import os.path
+import tempfile
+from livebridge_liveblog.cache import LRUCache, ImageCache, file_digest, get_image_cache, _image_caches
+
+
+def test_lru_cache():
+    cache = LRUCache(2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert list(cache) == ["a", "c"]
+    assert "b" not in cache
+    assert cache.get("b", "foo") == "foo"
+    assert cache.pop("a") == 1
+    assert len(cache) == 1
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_file_digest():
+    path = os.path.join(os.path.dirname(__file__), "test.jpg")
+    with open(path, "rb") as f:
+        assert file_digest(path, chunk_size=100) == hashlib.sha256(f.read()).hexdigest()
+
+
+def test_get_image_cache():
+    _image_caches.clear()
+    cache = get_image_cache("https://example.com/api", size=5)
+    assert cache is get_image_cache("https://example.com/api")
+    assert cache is not get_image_cache("https://example.org/api")
+    assert cache.size == 5
+    _image_caches.clear()
+
+
+def test_image_cache_persistent():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "images.jsonl")
+        cache = ImageCache(size=2, path=path)
+        for num in range(3):
+            cache.set("hash-{}".format(num), {"_id": num})
+        assert list(cache) == ["hash-1", "hash-2"]
+
+        loaded = ImageCache(size=2, path=path)
+        assert list(loaded) == ["hash-1", "hash-2"]
+        assert loaded.get("hash-2") == {"_id": 2}
+
+        # file gets compacted
+        cache.set("hash-3", {"_id": 3})
+        cache.set("hash-4", {"_id": 4})
+        with open(path) as f:
+            assert len(f.readlines()) == 2
+        assert list(ImageCache(size=2, path=path)) == ["hash-3", "hash-4"]
+
+
+def test_image_cache_invalid_file():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "images.jsonl")
+        with open(path, "w") as f:
+            f.write("foo\n")
+        cache = ImageCache(size=2, path=path)
+        assert len(cache) == 0
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os.path
+import tempfile
+from datetime import datetime, timedelta, timezone
+from livebridge_liveblog.checkpoint import CheckpointStore, get_checkpoint_store, _checkpoint_stores
+
+
+def test_get_checkpoint_store():
+    _checkpoint_stores.clear()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "checkpoints.jsonl")
+        store = get_checkpoint_store(path)
+        assert store is get_checkpoint_store(path)
+        assert store is not get_checkpoint_store(path + ".other")
+    _checkpoint_stores.clear()
+
+
+def test_checkpoint_store():
+    updated = datetime(2020, 3, 2, 10, 15, 30, tzinfo=timezone.utc)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "checkpoints.jsonl")
+        store = CheckpointStore(path)
+        assert store.get("foo") is None
+        store.set("foo", updated)
+        store.set("bar", updated - timedelta(days=1))
+        assert store.get("foo") == updated
+
+        loaded = CheckpointStore(path)
+        assert len(loaded) == 2
+        assert loaded.get("foo") == updated
+        assert loaded.get("bar") == updated - timedelta(days=1)
+
+        # unchanged checkpoints are not written again
+        store.set("foo", updated)
+        with open(path) as f:
+            assert len(f.readlines()) == 2
+
+
+def test_checkpoint_store_compact():
+    updated = datetime(2020, 3, 2, 10, 15, 30, tzinfo=timezone.utc)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "checkpoints.jsonl")
+        store = CheckpointStore(path)
+        for num in range(150):
+            store.set("foo", updated + timedelta(seconds=num))
+        with open(path) as f:
+            assert len(f.readlines()) < 100
+        assert CheckpointStore(path).get("foo") == updated + timedelta(seconds=149)
+
+
+def test_checkpoint_store_invalid_lines():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "checkpoints.jsonl")
+        with open(path, "w") as f:
+            f.write('{"key": "foo", "updated": "2020-03-02T10:15:30+00:00"}\n{"key": "ba')
+        store = CheckpointStore(path)
+        assert len(store) == 1
+        assert store.get("foo") == datetime(2020, 3, 2, 10, 15, 30, tzinfo=timezone.utc)
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asynctest
+from datetime import datetime, timedelta
+from livebridge_liveblog import LiveblogLiveblogConverter, LiveblogSource, LiveblogTarget
+from livebridge_liveblog import breaker
+from livebridge_liveblog.breaker import CircuitBreaker
+from benchmarks.fake_liveblog import FakeLiveblog
+
+
+class FakeLiveblogTests(asynctest.TestCase):
+
+    async def setUp(self):
+        self.fake = FakeLiveblog()
+        self.endpoint = await self.fake.start()
+        self.start = datetime.utcnow().replace(microsecond=0) - timedelta(minutes=10)
+        self.source = LiveblogSource(config={"endpoint": self.endpoint, "source_id": "blog-1",
+                                             "label": "Source", "page_size": 2})
+        self.source.get_last_updated = asynctest.CoroutineMock(return_value=self.start - timedelta(seconds=1))
+        self.target = LiveblogTarget(config={"endpoint": self.endpoint, "target_id": "blog-2", "label": "Target",
+                                             "auth": {"user": "foo", "password": "bla"}})
+        self.converter = LiveblogLiveblogConverter()
+        self.images = []
+
+    async def tearDown(self):
+        await self.converter.remove_images(self.images)
+        self.converter._cache.clear()
+        await self.source.stop()
+        await self.target.stop()
+        await self.fake.stop()
+        breaker._breakers.clear()
+
+    async def _convert(self, post):
+        conversion = await self.converter.convert(post.data)
+        post.content = conversion.content
+        post.images = conversion.images
+        self.images.extend(conversion.images)
+        return post
+
+    async def test_poll_convert_post_update(self):
+        self.fake.add_posts("blog-1", 3, images=1, texts=2, start=self.start)
+        posts = await self.source.poll()
+        assert len(posts) == 3
+        # second page starts at the last post of the first one
+        assert self.fake.requests["GET /api/client_blogs/{blog_id}/posts"] == 3
+        assert await self.source.poll() == []
+
+        post = await self._convert(posts[0])
+        assert [item["item_type"] for item in post.content] == ["text", "image", "text"]
+        target_doc = await self.target.post_item(post)
+        assert target_doc["_id"] in self.fake.posts
+        assert self.fake.requests["POST /api/items"] == 3
+        assert self.fake.requests["POST /api/archive"] == 1
+
+        # edit at the source, only the changed text item is saved again
+        edited = self.fake.edit_post("blog-1", posts[0].id, "changed", updated=datetime.utcnow())
+        posts = await self.source.poll()
+        assert [p.id for p in posts] == [edited["_id"]]
+        post = await self._convert(posts[0])
+        post.target_doc = target_doc
+        res = await self.target.update_item(post)
+        assert res["_id"] == target_doc["_id"]
+        assert self.fake.requests["POST /api/items"] == 4
+        assert self.fake.requests["POST /api/archive"] == 1
+        assert self.fake.posts[res["_id"]]["groups"][1]["refs"][0]["residRef"] != \
+            target_doc["groups"][1]["refs"][0]["residRef"]
+
+    async def test_projection(self):
+        self.fake.add_posts("blog-1", 2, images=1, texts=2, start=self.start)
+        posts = await self.source.poll()
+        full_bytes = self.source.last_poll_bytes
+
+        projected = LiveblogSource(config={"endpoint": self.endpoint, "source_id": "blog-1", "projection": True})
+        projected.get_last_updated = self.source.get_last_updated
+        projected_posts = await projected.poll()
+        await projected.stop()
+        assert projected.last_poll_bytes < full_bytes / 2
+        for post, projected_post in zip(posts, projected_posts):
+            assert projected_post.get_action() == post.get_action() == "create"
+            assert projected_post.updated == post.updated
+            # same content, apart from the local paths of downloaded images
+            content = [(await self._convert(p)).content for p in (post, projected_post)]
+            for item in content[0] + content[1]:
+                item.pop("tmp_path", None)
+            assert content[0] == content[1]
+
+    async def test_stream_posts(self):
+        self.fake.add_posts("blog-1", 5, images=1, texts=2, start=self.start)
+        posts = await self.source.poll()
+        streaming = LiveblogSource(config={"endpoint": self.endpoint, "source_id": "blog-1",
+                                           "page_size": 2, "stream_posts": True})
+        streaming.get_last_updated = self.source.get_last_updated
+        streamed_posts = await streaming.poll()
+        await streaming.stop()
+        assert [p.data for p in streamed_posts] == [p.data for p in posts]
+        assert streaming.last_updated == self.source.last_updated
+        assert streaming.last_poll_bytes == self.source.last_poll_bytes
+        assert self.fake.requests["GET /api/client_blogs/{blog_id}/posts"] == 10
+
+    async def _poll_edited_between_pages(self, source, method):
+        self.fake.add_posts("blog-1", 6, start=self.start)
+        first_id = self.fake.blogs["blog-1"]["posts"][0]["_id"]
+        fetch = getattr(source, method)
+        edited = []
+
+        async def fetch_and_edit(*args, **kwargs):
+            res = await fetch(*args, **kwargs)
+            if not edited:
+                # the edited post moves behind the posts of the next page
+                edited.append(self.fake.edit_post("blog-1", first_id, "changed", updated=datetime.utcnow()))
+            return res
+
+        with asynctest.patch.object(source, method, side_effect=fetch_and_edit):
+            posts = await source.poll()
+        assert sorted(p.id for p in posts) == sorted(p["_id"] for p in self.fake.blogs["blog-1"]["posts"])
+        assert posts[-1].id == first_id
+        assert posts[-1].data["groups"][1]["refs"][0]["item"]["text"] == "changed"
+        await source.stop()
+
+    async def test_poll_post_edited_between_pages(self):
+        source = LiveblogSource(config={"endpoint": self.endpoint, "source_id": "blog-1", "page_size": 3})
+        source.get_last_updated = self.source.get_last_updated
+        await self._poll_edited_between_pages(source, "_fetch_page")
+
+    async def test_stream_post_edited_between_pages(self):
+        source = LiveblogSource(config={"endpoint": self.endpoint, "source_id": "blog-1", "page_size": 3,
+                                        "stream_posts": True})
+        source.get_last_updated = self.source.get_last_updated
+        await self._poll_edited_between_pages(source, "_get_stream")
+
+    async def test_injected_errors(self):
+        self.source._retry_backoff = 0
+        self.fake.error_rate = 1
+        self.fake.add_posts("blog-1", 1, start=self.start)
+        assert await self.source.poll() == []
+        # status check is sent three times, the second posts request opens the circuit
+        assert self.fake.requests["GET /api/client_blogs/{blog_id}"] == 3
+        assert self.fake.requests["GET /api/client_blogs/{blog_id}/posts"] == 2
+        assert self.source._breaker.state == CircuitBreaker.OPEN
+
+        self.fake.error_rate = 0
+        assert await self.source.poll() == []
+        assert sum(self.fake.requests.values()) == 5
+
+        # trial request after the reset timeout closes the circuit
+        self.source._breaker._opened_at -= self.source._breaker.reset_timeout
+        assert len(await self.source.poll()) == 1
+        assert self.source._breaker.state == CircuitBreaker.CLOSED
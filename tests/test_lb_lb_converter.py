@@ -13,17 +13,32 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import asyncio
 import asynctest
+import copy
 import os.path
-from livebridge_liveblog import LiveblogLiveblogConverter
+import tempfile
+from livebridge_liveblog import LiveblogLiveblogConverter, converters
 from livebridge.base import ConversionResult
+from livebridge.components import add_converter, get_converter
 from tests import load_json
 
 class LiveblogLiveblogConverterTest(asynctest.TestCase):
 
     def setUp(self):
+        self._clear_caches()
+        add_converter(LiveblogLiveblogConverter)
         self.converter = LiveblogLiveblogConverter()
 
+    def tearDown(self):
+        self._clear_caches()
+
+    @staticmethod
+    def _clear_caches():
+        for cache in converters._conversion_caches.values():
+            cache.clear()
+        converters._conversion_caches.clear()
+
     async def test_convert(self):
         post = load_json('post_to_convert.json')
         result = await self.converter.convert(post)
@@ -50,3 +65,139 @@ class LiveblogLiveblogConverterTest(asynctest.TestCase):
         post["groups"][1]["refs"][1]["item"]["item_type"] = "baz"
         result = await self.converter.convert(post)
         assert len(result.content) == 5
+
+    async def test_convert_images_parallel(self):
+        post = load_json('post_to_convert.json')
+        refs = post["groups"][1]["refs"]
+        image = refs[1]
+        # gallery like post: text, 4 images, text
+        post["groups"][1]["refs"] = [refs[0]] + [copy.deepcopy(image) for _ in range(4)] + [refs[2]]
+        running = []
+        max_running = []
+
+        async def download(data):
+            num = len(max_running)
+            running.append(num)
+            max_running.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(num)
+            return "/tmp/image-{}.jpg".format(num)
+
+        self.converter.image_concurrency = 2
+        self.converter._download_image = asynctest.CoroutineMock(side_effect=download)
+        result = await self.converter.convert(post)
+        assert [i["item_type"] for i in result.content] == ["text", "image", "image", "image", "image", "text"]
+        assert [i["tmp_path"] for i in result.content[1:5]] == result.images
+        assert result.images == ["/tmp/image-{}.jpg".format(num) for num in range(4)]
+        assert max(max_running) == 2
+
+    async def test_convert_failure_awaits_downloads(self):
+        post = load_json('post_to_convert.json')
+        # invalid ref after image
+        del post["groups"][1]["refs"][2]["item"]
+        self.converter._download_image = asynctest.CoroutineMock(return_value="/tmp/image.jpg")
+        result = await self.converter.convert(post)
+        assert [i["item_type"] for i in result.content] == ["text", "image"]
+        assert result.images == ["/tmp/image.jpg"]
+
+    async def test_convert_cached(self):
+        post = load_json('post_to_convert.json')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = []
+
+            async def download(data):
+                paths.append(os.path.join(tmp_dir, "image-{}.jpg".format(len(paths))))
+                with open(paths[-1], "wb") as f:
+                    f.write(b"foo")
+                return paths[-1]
+
+            async def handle_post(post):
+                # livebridge creates a new converter for every post
+                converter = get_converter("liveblog", "liveblog")
+                conversion = await converter.convert(post)
+                await converter.remove_images(conversion.images)
+                return conversion
+
+            with asynctest.patch.object(LiveblogLiveblogConverter, "_download_image", side_effect=download) as dl, \
+                    asynctest.patch.object(LiveblogLiveblogConverter, "_convert_text",
+                                           side_effect=self.converter._convert_text) as convert_text:
+                first = await handle_post(post)
+                assert first.images == paths
+                # cached image isn't removed after the post was handled
+                assert os.listdir(tmp_dir) == ["image-0.jpg"]
+
+                # unchanged post, nothing converted again
+                text_calls = convert_text.call_count
+                second = await handle_post(post)
+                assert second.content == first.content
+                assert second.content[0] is not first.content[0]
+                assert second.images == first.images
+                assert dl.call_count == 1
+                assert convert_text.call_count == text_calls
+                assert os.listdir(tmp_dir) == ["image-0.jpg"]
+
+                # edited image, new download replaces the old file
+                post["groups"][1]["refs"][1]["item"]["_etag"] = "changed"
+                third = await handle_post(post)
+                assert third.images == [paths[1]]
+                assert dl.call_count == 2
+                assert convert_text.call_count == text_calls
+                assert os.listdir(tmp_dir) == ["image-1.jpg"]
+
+            # dropped from the cache, image file is removed too
+            converters._conversion_caches[("liveblog", "liveblog")].clear()
+            assert os.listdir(tmp_dir) == []
+
+    async def test_convert_cached_image_in_use(self):
+        post = load_json('post_to_convert.json')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = []
+
+            async def download(data):
+                paths.append(os.path.join(tmp_dir, "image-{}.jpg".format(len(paths))))
+                with open(paths[-1], "wb") as f:
+                    f.write(b"foo")
+                return paths[-1]
+
+            with asynctest.patch.object(LiveblogLiveblogConverter, "_download_image", side_effect=download):
+                # two bridges of the same source, the first one is still uploading the image
+                uploading = get_converter("liveblog", "liveblog")
+                first = await uploading.convert(post)
+                other = get_converter("liveblog", "liveblog")
+                second = await other.convert(post)
+                assert second.images == first.images
+
+                # edited image replaces the cached one, file is kept until the upload is done
+                post["groups"][1]["refs"][1]["item"]["_etag"] = "changed"
+                third = await other.convert(post)
+                await other.remove_images(second.images + third.images)
+                assert sorted(os.listdir(tmp_dir)) == ["image-0.jpg", "image-1.jpg"]
+                await uploading.remove_images(first.images)
+                assert os.listdir(tmp_dir) == ["image-1.jpg"]
+
+                # evicted image is kept until the converter using it is done
+                cache = converters._conversion_caches[("liveblog", "liveblog")]
+                fourth = await other.convert(post)
+                cache.clear()
+                assert os.listdir(tmp_dir) == ["image-1.jpg"]
+                await other.remove_images(fourth.images)
+                assert os.listdir(tmp_dir) == []
+
+    async def test_convert_cache_disabled(self):
+        post = load_json('post_to_convert.json')
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                asynctest.patch.object(LiveblogLiveblogConverter, "cache_size", 0):
+            path = os.path.join(tmp_dir, "image.jpg")
+
+            async def download(data):
+                with open(path, "wb") as f:
+                    f.write(b"foo")
+                return path
+
+            with asynctest.patch.object(LiveblogLiveblogConverter, "_download_image", side_effect=download) as dl:
+                for _ in range(2):
+                    converter = get_converter("liveblog", "liveblog")
+                    conversion = await converter.convert(post)
+                    await converter.remove_images(conversion.images)
+                    assert os.listdir(tmp_dir) == []
+            assert dl.call_count == 2
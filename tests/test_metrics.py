@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import aiohttp
+import asynctest
+from livebridge_liveblog import LiveblogSource
+from livebridge_liveblog.metrics import RequestMetrics, get_operation
+from tests.test_source import TestResponse
+
+
+class RequestMetricsTests(asynctest.TestCase):
+
+    def setUp(self):
+        self.metrics = RequestMetrics(buckets=(0.1, 1.0))
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_get_operation(self):
+        endpoint = "https://example.com/api"
+        assert get_operation(endpoint, "get", endpoint + "/client_blogs/123/posts?page=1") == \
+            "GET client_blogs/{id}/posts"
+        assert get_operation(endpoint, "patch", endpoint + "/posts/urn:abc") == "PATCH posts/{id}"
+        assert get_operation(endpoint, "post", endpoint + "/auth") == "POST auth"
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_observe(self):
+        self.metrics.observe("https://a", "GET items", 200, 0.05, bytes_in=10, bytes_out=2)
+        self.metrics.observe("https://a", "GET items", 200, 0.5, bytes_in=5)
+        self.metrics.observe("https://a", "GET items", 200, 3)
+        self.metrics.observe("https://a", "GET items", "error", 0.01)
+        hist = self.metrics.latency[("https://a", "GET items", "200")]
+        assert hist.buckets == [1, 1]
+        assert hist.count == 3
+        assert hist.sum == 3.55
+        assert self.metrics.bytes_in[("https://a", "GET items", "200")] == 15
+        assert self.metrics.bytes_out[("https://a", "GET items", "200")] == 2
+        assert self.metrics.latency[("https://a", "GET items", "error")].count == 1
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_to_prometheus(self):
+        self.metrics.observe("https://a", "GET items", 200, 0.05, bytes_in=10, bytes_out=2)
+        self.metrics.observe("https://a", "GET items", 200, 3)
+        self.metrics.observe_login("https://a", True)
+        text = self.metrics.to_prometheus(prefix="lb")
+        labels = 'endpoint="https://a",operation="GET items",status="200"'
+        assert '# TYPE lb_request_duration_seconds histogram' in text
+        assert 'lb_request_duration_seconds_bucket{' + labels + ',le="0.1"} 1' in text
+        assert 'lb_request_duration_seconds_bucket{' + labels + ',le="1.0"} 1' in text
+        assert 'lb_request_duration_seconds_bucket{' + labels + ',le="+Inf"} 2' in text
+        assert 'lb_request_duration_seconds_count{' + labels + '} 2' in text
+        assert 'lb_bytes_received_total{' + labels + '} 10' in text
+        assert 'lb_bytes_sent_total{' + labels + '} 2' in text
+        assert 'lb_logins_total{endpoint="https://a",result="success"} 1' in text
+        assert text.endswith("\n")
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_observe_poll(self):
+        self.metrics.observe_poll("https://a", 1000, 2)
+        self.metrics.observe_poll("https://a", 500, 0)
+        assert self.metrics.polls["https://a"] == 2
+        text = self.metrics.to_prometheus(prefix="lb")
+        assert 'lb_poll_bytes_sum{endpoint="https://a"} 1500' in text
+        assert 'lb_poll_bytes_count{endpoint="https://a"} 2' in text
+        assert 'lb_poll_posts_total{endpoint="https://a"} 2' in text
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_callbacks(self):
+        samples = []
+        self.metrics.add_callback(samples.append)
+        self.metrics.add_callback(asynctest.MagicMock(side_effect=Exception("fails")))
+        self.metrics.observe("https://a", "GET items", 404, 0.05)
+        self.metrics.observe_login("https://a", False)
+        assert samples[0]["status"] == 404
+        assert samples[0]["duration"] == 0.05
+        assert samples[1] == {"type": "login", "endpoint": "https://a", "result": "failure"}
+        self.metrics.remove_callback(samples.append)
+        self.metrics.observe("https://a", "GET items", 200, 0.05)
+        assert len(samples) == 2
+
+    async def test_client_requests(self):
+        client = LiveblogSource(config={"endpoint": "https://example.com/api", "source_id": 1})
+        client._metrics = self.metrics
+        resp = TestResponse(url="", data=b'{"foo": "bar"}')
+        resp._status = 200
+        client._session = asynctest.MagicMock(close=asynctest.CoroutineMock(return_value=None))
+        client._session.get = asynctest.MagicMock(return_value=resp)
+        client._session.post = asynctest.MagicMock(side_effect=aiohttp.ClientOSError())
+        assert await client._get("https://example.com/api/client_blogs/1/posts") == {"foo": "bar"}
+        assert await client._login() is False
+        key = ("https://example.com/api", "GET client_blogs/{id}/posts", "200")
+        assert self.metrics.latency[key].count == 1
+        assert self.metrics.bytes_in[key] == 14
+        assert self.metrics.latency[("https://example.com/api", "POST auth", "error")].count == 1
+        assert self.metrics.logins[("https://example.com/api", "failure")] == 1
+        await client.stop()
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_disabled(self):
+        client = LiveblogSource(config={"endpoint": "https://example.com/api", "source_id": 1, "metrics": False})
+        assert client._metrics is None
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import inspect
+import subprocess
+import sys
+import livebridge_liveblog
+from livebridge_liveblog.post import LiveblogPost
+
+
+def test_lazy_import():
+    # fresh interpreter, modules of this one are already loaded
+    code = "import sys, livebridge_liveblog.metrics; print('aiohttp' in sys.modules)"
+    res = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE, check=True)
+    assert res.stdout.strip() == b"False"
+
+
+def test_lazy_attributes():
+    assert livebridge_liveblog.LiveblogPost is LiveblogPost
+    members = dict(inspect.getmembers(livebridge_liveblog, inspect.isclass))
+    assert set(livebridge_liveblog.__all__) <= set(members)
+    try:
+        livebridge_liveblog.Foo
+        assert False
+    except AttributeError:
+        pass
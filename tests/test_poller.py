@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import asynctest
+from datetime import datetime, timezone
+from livebridge_liveblog import LiveblogPost, LiveblogSource
+from livebridge_liveblog import poller
+from livebridge_liveblog.poller import SharedPoller
+
+
+def make_post(num, tags=None):
+    updated = "2016-03-29T13:{:02d}:00+00:00".format(num)
+    return LiveblogPost({"_id": "post-{}".format(num), "_created": updated, "_updated": updated, "tags": tags})
+
+
+class SharedPollerTests(asynctest.TestCase):
+
+    def setUp(self):
+        self.conf = {
+            "source_id": 12345,
+            "endpoint": "https://example.com/api",
+            "label": "Testlabel",
+            "shared_poll": True,
+        }
+        self.sources = []
+
+    async def tearDown(self):
+        for source in self.sources:
+            await source.stop()
+        assert poller._pollers == {}
+
+    def _source(self, **conf):
+        source = LiveblogSource(config=dict(self.conf, **conf))
+        source.get_last_updated = asynctest.CoroutineMock(return_value=datetime(2016, 3, 29, 13, 0, 0))
+        self.sources.append(source)
+        return source
+
+    def _mock_fetch(self, shared, *results):
+        results = list(results)
+
+        async def poll():
+            posts = results.pop(0) if results else []
+            for p in posts:
+                shared.fetcher.last_updated = p.updated
+            return posts
+        shared.fetcher.poll = asynctest.CoroutineMock(side_effect=poll)
+
+    async def test_get_shared_poller(self):
+        one = self._source()
+        two = self._source(filter_tags="foo")
+        three = self._source(source_id=54321)
+        assert one._shared_poller is two._shared_poller
+        assert one._shared_poller is not three._shared_poller
+        assert type(one._shared_poller) == SharedPoller
+        assert one._shared_poller.fetcher.filter_tags == None
+        assert one._shared_poller.fetcher._shared_poller == None
+        assert LiveblogSource(config={"source_id": 1, "endpoint": "https://example.com"})._shared_poller == None
+
+    async def test_unsubscribe(self):
+        one = self._source()
+        shared = one._shared_poller
+        shared.fetcher.stop = asynctest.CoroutineMock(return_value=None)
+        self._mock_fetch(shared)
+        await one.poll()
+        assert list(shared._pending) == [one]
+        await shared.unsubscribe(one)
+        assert shared._pending == {}
+        assert shared.key not in poller._pollers
+        assert shared.fetcher.stop.call_count == 1
+
+    async def test_fan_out(self):
+        one = self._source()
+        two = self._source(filter_tags="foo, bar")
+        shared = one._shared_poller
+        self._mock_fetch(shared, [make_post(1, ["foo"]), make_post(2), make_post(3, ["bar", "baz"])])
+        posts_one, posts_two = await asyncio.gather(one.poll(), two.poll())
+        assert [p.id for p in posts_one] == ["post-1", "post-2", "post-3"]
+        assert [p.id for p in posts_two] == ["post-1", "post-3"]
+        assert shared.fetcher.poll.call_count == 1
+        # every subscriber gets its own post objects
+        assert posts_one[0] is not posts_two[0]
+        assert posts_one[0]._payload is posts_two[0]._payload
+        assert one.last_updated == two.last_updated == posts_one[-1].updated
+
+        # within interval, no new fetch
+        assert await one.poll() == []
+        assert shared.fetcher.poll.call_count == 1
+
+    async def test_poll_after_interval(self):
+        one = self._source()
+        two = self._source()
+        shared = one._shared_poller
+        shared.interval = 0
+        self._mock_fetch(shared, [make_post(1)], [make_post(1), make_post(2)], [make_post(3)])
+        assert [p.id for p in await one.poll()] == ["post-1"]
+        # second subscriber starts at an older cursor, first one skips known posts
+        assert [p.id for p in await two.poll()] == ["post-1", "post-2"]
+        assert [p.id for p in await one.poll()] == ["post-2", "post-3"]
+        assert [p.id for p in await two.poll()] == ["post-3"]
+        assert shared.fetcher.poll.call_count == 4
+
+    async def test_subscriber_behind(self):
+        one = self._source()
+        shared = one._shared_poller
+        self._mock_fetch(shared, [make_post(5)], [make_post(2), make_post(5)])
+        assert [p.id for p in await one.poll()] == ["post-5"]
+        assert one.last_updated == make_post(5).updated
+
+        # new subscriber with older cursor rewinds the shared cursor
+        two = self._source()
+        two.get_last_updated = asynctest.CoroutineMock(return_value=datetime(2016, 3, 29, 13, 1, 0))
+        assert [p.id for p in await two.poll()] == ["post-2", "post-5"]
+        assert shared.fetcher.poll.call_count == 2
+        # first one skips what it already got
+        assert await one.poll() == []
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_utc(self):
+        naive = datetime(2016, 3, 29, 13, 0, 0)
+        assert poller._utc(naive) == datetime(2016, 3, 29, 13, 0, 0, tzinfo=timezone.utc)
+        aware = make_post(1).updated
+        assert poller._utc(aware) is aware
+
+    async def test_match_filter_tags(self):
+        source = LiveblogSource(config={"source_id": 1, "endpoint": "https://example.com", "filter_tags": "a, b"})
+        assert source._match_filter_tags(make_post(1, ["b"])) == True
+        assert source._match_filter_tags(make_post(1, ["c"])) == False
+        assert source._match_filter_tags(make_post(1)) == False
+        source.filter_tags = None
+        assert source._match_filter_tags(make_post(1)) == True
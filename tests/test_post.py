@@ -14,8 +14,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import asynctest
-from datetime import datetime
+import json
+import tracemalloc
+from datetime import datetime, timezone
+from dateutil.parser import parse as parse_date
 from livebridge_liveblog import LiveblogPost
+from livebridge_liveblog.post import parse_timestamp, UNPACKED_FIELDS
 from tests import load_json
 
 class LiveblogPostTest(asynctest.TestCase):
@@ -47,17 +51,17 @@ class LiveblogPostTest(asynctest.TestCase):
     def test_get_action(self):
         # ignore/submitted
         self.lp._existing = None
-        self.post["post_status"] = "submitted"
+        self.lp.data["post_status"] = "submitted"
         assert self.lp.get_action() == "ignore"
         # ignore/draft
-        self.post["post_status"] = "draft"
+        self.lp.data["post_status"] = "draft"
         assert self.lp.get_action() == "ignore"
         # no ignore, post is known
         self.lp._existing = {"foo":"baz"}
         assert self.lp.get_action() != "ignore"
 
         # should be update
-        self.post["post_status"] = ""
+        self.lp.data["post_status"] = ""
         assert self.lp.get_action() == "update"
 
         # test delete
@@ -148,3 +152,74 @@ class LiveblogPostTest(asynctest.TestCase):
     def test_target_id_from_existing(self):
         self.lp.set_existing({"target_id": "foobaz"})
         assert self.lp.target_id == "foobaz"
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_timestamps_cached(self):
+        with asynctest.patch("livebridge_liveblog.post.parse_timestamp", wraps=parse_timestamp) as patched:
+            updated = self.lp.updated
+            assert self.lp.updated is updated
+            assert patched.call_count == 1
+            # raw value changed
+            self.lp.data["_updated"] = "2016-05-06T15:00:59+00:00"
+            assert self.lp.updated.month == 5
+            assert patched.call_count == 2
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_compact(self):
+        lp = LiveblogPost(load_json('post_to_convert.json'))
+        assert lp._data is None
+        assert type(lp._payload) == bytes
+        assert "groups" not in UNPACKED_FIELDS
+        assert lp.id == self.post["_id"]
+        assert lp.is_deleted == False
+        assert lp.tags == []
+        assert lp.get_action() == "create"
+        # decoded on access
+        assert lp.data == self.post
+        assert lp.data is lp.data
+        # encoded payload is dropped once decoded
+        assert lp._payload is None
+        # fields of the post live in slots
+        assert "_payload" not in vars(lp)
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_copy(self):
+        lp = LiveblogPost(load_json('post_to_convert.json'))
+        copied = lp.copy()
+        assert copied is not lp
+        assert copied._payload is lp._payload
+        assert copied.data == lp.data
+        # changed data gets copied too
+        lp.data["sticky"] = True
+        assert lp.copy().is_sticky == True
+        assert copied.is_sticky == False
+
+
+def test_post_memory():
+    raw = [json.dumps(item) for item in load_json('posts.json')["_items"]] * 5
+
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        dicts = [json.loads(item) for item in raw]
+        dicts_size = tracemalloc.get_traced_memory()[0] - start
+        del dicts
+
+        start = tracemalloc.get_traced_memory()[0]
+        posts = [LiveblogPost(json.loads(item)) for item in raw]
+        posts_size = tracemalloc.get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+    assert len(posts) == len(raw)
+    assert posts_size < dicts_size * 0.6
+
+
+def test_parse_timestamp():
+    for value in ["2016-04-28T11:24:22+00:00", "2016-04-28T11:24:22Z", "2016-04-28T13:24:22+02:00",
+                  "2016-04-28T06:24:22.123-05:00", "2016-04-28T11:24:22.5+0000"]:
+        res = parse_timestamp(value)
+        assert res == parse_date(value)
+        assert res.utcoffset() == parse_date(value).utcoffset()
+    assert parse_timestamp("2016-04-28T11:24:22+00:00").tzinfo == timezone.utc
+    # fallback to dateutil
+    assert parse_timestamp("28.04.2016 11:24") == datetime(2016, 4, 28, 11, 24)
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import asynctest
+import time
+from livebridge_liveblog.ratelimit import PRIORITY_HIGH, RateLimiter, get_rate_limiter, _rate_limiters
+
+
+def test_get_rate_limiter():
+    _rate_limiters.clear()
+    assert get_rate_limiter("https://example.com/api") is None
+    limiter = get_rate_limiter("https://example.com/api", rate=5, burst=2)
+    assert limiter is get_rate_limiter("https://example.com/api")
+    with asynctest.patch("livebridge_liveblog.ratelimit.logger") as logger:
+        assert limiter is get_rate_limiter("https://example.com/api", rate=5, burst=2)
+        assert logger.warning.call_count == 0
+        # first limit applies, conflicting ones are logged
+        assert limiter is get_rate_limiter("https://example.com/api", rate=1)
+        assert logger.warning.call_count == 1
+    assert limiter is not get_rate_limiter("https://example.org/api", rate=5)
+    assert limiter.rate == 5
+    assert limiter.burst == 2
+    _rate_limiters.clear()
+
+
+class RateLimiterTests(asynctest.TestCase):
+
+    async def test_acquire_burst_and_rate(self):
+        limiter = RateLimiter("https://example.com/api", rate=50, burst=3)
+        start = time.monotonic()
+        for _ in range(3):
+            await limiter.acquire()
+        assert time.monotonic() - start < 0.01
+        assert limiter.waits == 0
+        for _ in range(5):
+            await limiter.acquire()
+        # 5 requests at 50 per second
+        assert time.monotonic() - start >= 0.09
+        assert limiter.waits == 5
+
+    async def test_acquire_priority(self):
+        limiter = RateLimiter("https://example.com/api", rate=100, burst=1)
+        await limiter.acquire()
+        order = []
+
+        async def request(name, **kwargs):
+            await limiter.acquire(**kwargs)
+            order.append(name)
+
+        await asyncio.gather(request("create-1"), request("create-2"), request("update", priority=PRIORITY_HIGH))
+        assert order == ["update", "create-1", "create-2"]
+
+    async def test_acquire_cancelled(self):
+        limiter = RateLimiter("https://example.com/api", rate=100, burst=1)
+        await limiter.acquire()
+        waiting = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        await asyncio.wait_for(limiter.acquire(), 0.1)
+        assert limiter.tokens < 1
@@ -13,13 +13,18 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import asyncio
 import asynctest
 import aiohttp
 import json
 from datetime import datetime
 from urllib.parse import parse_qs
+import os.path
+import tempfile
+from livebridge_liveblog import breaker, checkpoint, codec, common, ratelimit
 from livebridge_liveblog.common import LiveblogClient, comma_split
 from livebridge_liveblog import LiveblogPost, LiveblogSource
+from livebridge_liveblog.source import POST_FIELDS
 from livebridge.base import PollingSource, InvalidTargetResource
 from tests import load_json
 
@@ -45,6 +50,9 @@ class TestResponse:
     async def json(self):
         return json.loads(self.req_data.decode("utf-8")) if self.req_data else {"foo": "baz"}
 
+    async def read(self):
+        return self.req_data if self.req_data else b'{"foo": "baz"}'
+
     async def text(self):
         return "text"
 
@@ -56,6 +64,8 @@ class InvalidResponse(TestResponse):
 class LiveblogSourceTests(asynctest.TestCase):
 
     def setUp(self):
+        breaker._breakers.clear()
+        ratelimit._rate_limiters.clear()
         self.conf = {
             "auth": {
                 "user": "foo",
@@ -92,11 +102,19 @@ class LiveblogSourceTests(asynctest.TestCase):
     def test_session(self):
         assert self.client._session == None
         self.client.session_token = "baz"
-        self.client._get_auth_header = asynctest.CoroutineMock(return_value={})
         session = self.client.session
         assert type(session) == aiohttp.client.ClientSession
         assert self.client._session == session
-        assert self.client._get_auth_header.call_count == 1
+        assert "Authorization" not in session._default_headers
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_get_request_headers(self):
+        assert self.client._get_request_headers("https://example.com/api/items") == {}
+        self.client.session_token = "baz"
+        headers = self.client._get_request_headers("https://example.com/api/items", {"X-Foo": "bar"})
+        assert headers == dict(self.client._get_auth_header(), **{"X-Foo": "bar"})
+        # no auth header for login
+        assert self.client._get_request_headers("https://example.com/api/auth") == {}
 
     async def test_stop_bridge(self):
         session = asynctest.MagicMock()
@@ -123,13 +141,168 @@ class LiveblogSourceTests(asynctest.TestCase):
         assert self.client._post.call_args_list[0][0][0] == 'https://example.com/api/auth'
         assert json.loads(self.client._post.call_args_list[0][0][1]) == {'password': 'bla', 'username': 'foo'}
         assert self.client._post.call_args_list[0][1]["status"] == 201
-        assert self.client._session == None
+        # pooled session is kept
+        assert self.client._session != None
+        assert self.client._has_valid_token() == True
 
     async def test_login_not_ok(self):
         self.client._post = asynctest.CoroutineMock(side_effect=aiohttp.client_exceptions.ClientOSError)
         res = await self.client._login()
         assert res == False
 
+        self.client._post = asynctest.CoroutineMock(return_value=None)
+        res = await self.client._login()
+        assert res == False
+
+    async def test_login_shared(self):
+        async def post(*args, **kwargs):
+            await asyncio.sleep(0.01)
+            return {"token": "foo"}
+        self.client._post = asynctest.CoroutineMock(side_effect=post)
+        res = await asyncio.gather(*[self.client._ensure_login() for _ in range(5)])
+        assert res == ["foo"] * 5
+        assert self.client._post.call_count == 1
+        assert self.client._login_future == None
+
+    async def test_ensure_login(self):
+        self.client._post = asynctest.CoroutineMock(return_value={"token": "foo"})
+        assert await self.client._ensure_login() == "foo"
+        assert await self.client._ensure_login() == "foo"
+        assert self.client._post.call_count == 1
+
+        # token expired
+        self.client._token_expires = 0
+        assert await self.client._ensure_login() == "foo"
+        assert self.client._post.call_count == 2
+
+    async def test_request_relogin_on_401(self):
+        self.client.session_token = "old"
+        responses = [TestResponse(url="", data=b'{}'), TestResponse(url="", data=b'{"ok": 1}')]
+        responses[0]._status = 401
+        responses[1]._status = 200
+        session = asynctest.MagicMock(close=asynctest.CoroutineMock(return_value=None))
+        session.get = asynctest.MagicMock(side_effect=responses)
+        self.client._session = session
+
+        async def login():
+            self.client.session_token = "new"
+            return "new"
+        self.client._login = asynctest.CoroutineMock(side_effect=login)
+        res = await self.client._get("https://example.com/api/items")
+        assert res == {"ok": 1}
+        assert self.client._login.call_count == 1
+        assert session.get.call_count == 2
+        assert session.get.call_args[1]["headers"] == self.client._get_auth_header()
+
+        # still 401 after login, gives up
+        responses = [TestResponse(url=""), TestResponse(url="")]
+        for resp in responses:
+            resp._status = 401
+        session.get = asynctest.MagicMock(side_effect=responses)
+        res = await self.client._get("https://example.com/api/items")
+        assert res == {}
+        assert self.client._login.call_count == 2
+        assert session.get.call_count == 2
+
+    async def test_request_retry(self):
+        self.client._retry_backoff = 0
+        responses = [TestResponse(url=""), TestResponse(url=""), TestResponse(url="", data=b'{"ok": 1}')]
+        responses[0]._status = 503
+        responses[2]._status = 200
+        session = asynctest.MagicMock(close=asynctest.CoroutineMock(return_value=None))
+        session.get = asynctest.MagicMock(side_effect=[responses[0], aiohttp.ClientOSError(), responses[2]])
+        self.client._session = session
+        assert await self.client._get("https://example.com/api/items") == {"ok": 1}
+        assert session.get.call_count == 3
+
+        # gives up after "retries"
+        session.get = asynctest.MagicMock(side_effect=aiohttp.ClientOSError())
+        with self.assertRaises(aiohttp.ClientOSError):
+            await self.client._request("get", "https://example.com/api/items")
+        assert session.get.call_count == 3
+
+        # POST is not retried
+        resp = TestResponse(url="")
+        resp._status = 503
+        session.post = asynctest.MagicMock(return_value=resp)
+        status, _, _ = await self.client._request("post", "https://example.com/api/items", data=b"{}")
+        assert status == 503
+        assert session.post.call_count == 1
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_retry_delay(self):
+        self.client._retry_backoff = 1
+        self.client._retry_max_backoff = 5
+        with asynctest.patch("livebridge_liveblog.common.random.uniform", side_effect=lambda a, b: b):
+            assert [self.client._get_retry_delay(a) for a in range(5)] == [1, 2, 4, 5, 5]
+
+    async def test_request_circuit_open(self):
+        self.client._retry_backoff = 0
+        resp = TestResponse(url="")
+        resp._status = 502
+        session = asynctest.MagicMock(close=asynctest.CoroutineMock(return_value=None))
+        session.get = asynctest.MagicMock(return_value=resp)
+        self.client._session = session
+        assert await self.client._get("https://example.com/api/items") == {}
+        assert await self.client._get("https://example.com/api/items") == {}
+        # threshold of 5 failures reached during the retries of the second call
+        assert session.get.call_count == 5
+        assert self.client._breaker.state == "open"
+
+        # other clients of the same endpoint fail fast too
+        other = LiveblogSource(config=self.conf)
+        with self.assertRaises(breaker.CircuitOpenError):
+            await other._request("get", "https://example.com/api/items")
+        assert session.get.call_count == 5
+        await other.stop()
+
+        conf = dict(self.conf, circuit_breaker_threshold=0)
+        assert LiveblogSource(config=conf)._breaker is None
+
+    async def test_request_rate_limited(self):
+        self.client = LiveblogSource(config=dict(self.conf, write_rate=10, write_burst=2))
+        self.client._rate_limiter.acquire = asynctest.CoroutineMock(return_value=None)
+        session = asynctest.MagicMock(close=asynctest.CoroutineMock(return_value=None))
+        session.get = asynctest.MagicMock(return_value=TestResponse(url=""))
+        session.post = asynctest.MagicMock(return_value=TestResponse(url=""))
+        session.patch = asynctest.MagicMock(return_value=TestResponse(url=""))
+        self.client._session = session
+        await self.client._request("get", "https://example.com/api/items")
+        await self.client._request("post", "https://example.com/api/auth")
+        assert self.client._rate_limiter.acquire.call_count == 0
+        await self.client._request("post", "https://example.com/api/items")
+        await self.client._request("patch", "https://example.com/api/posts/1")
+        assert [c[0][0] for c in self.client._rate_limiter.acquire.call_args_list] == [
+            ratelimit.PRIORITY_NORMAL, ratelimit.PRIORITY_HIGH]
+        # clients without write_rate share the limit of their endpoint
+        other = LiveblogSource(config=self.conf)
+        assert other._rate_limiter is self.client._rate_limiter
+        other._session = session
+        await other._request("post", "https://example.com/api/items")
+        assert self.client._rate_limiter.acquire.call_count == 3
+        await other.stop()
+        assert LiveblogSource(config=dict(self.conf, endpoint="https://example.org/api"))._rate_limiter is None
+
+    async def test_request_breaker_before_rate_limit(self):
+        self.client = LiveblogSource(config=dict(self.conf, write_rate=10))
+        self.client._rate_limiter.acquire = asynctest.CoroutineMock(return_value=None)
+        self.client._breaker.allow = asynctest.Mock(return_value=False)
+        with self.assertRaises(breaker.CircuitOpenError):
+            await self.client._send("post", "https://example.com/api/items", "{}", {})
+        assert self.client._rate_limiter.acquire.call_count == 0
+
+    async def test_request_no_relogin_without_user(self):
+        self.client.user = None
+        resp = TestResponse(url="")
+        resp._status = 401
+        session = asynctest.MagicMock(close=asynctest.CoroutineMock(return_value=None))
+        session.get = asynctest.MagicMock(return_value=resp)
+        self.client._session = session
+        self.client._login = asynctest.CoroutineMock(return_value="foo")
+        status, _, _ = await self.client._request("get", "https://example.com/api/client_blogs/1")
+        assert status == 401
+        assert self.client._login.call_count == 0
+
     async def test_get_failing(self):
         self.client._session = asynctest.MagicMock(
             close=asynctest.CoroutineMock(return_value=None))
@@ -183,6 +356,38 @@ class LiveblogSourceTests(asynctest.TestCase):
         with self.assertRaises(Exception):
             params = await self.client._get_posts_params()
 
+    async def test_poll_checkpoint(self):
+        checkpoint._checkpoint_stores.clear()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            conf = dict(self.conf, checkpoint_path=os.path.join(tmp_dir, "checkpoints.jsonl"))
+            source = LiveblogSource(config=conf)
+            source._is_source_open = asynctest.CoroutineMock(return_value=True)
+            source._get = asynctest.CoroutineMock(return_value=load_json('posts.json'))
+            source.last_updated = datetime(2016, 10, 20, 15, 22, 30)
+            posts = await source.poll()
+            assert len(posts) > 0
+            # written when the next poll confirms the posts were handled
+            assert source._checkpoints.get(source._checkpoint_key) is None
+            source._get = asynctest.CoroutineMock(return_value={})
+            await source.poll()
+            assert source._checkpoints.get(source._checkpoint_key) == posts[-1].updated
+            await source.stop()
+
+            # restarted source reads cursor from checkpoint
+            checkpoint._checkpoint_stores.clear()
+            source = LiveblogSource(config=conf)
+            source.get_last_updated = asynctest.CoroutineMock(return_value=None)
+            updated = await source._get_updated()
+            assert updated == {"gt": posts[-1].updated.strftime("%Y-%m-%dT%H:%M:%S+00:00")}
+            assert source.get_last_updated.call_count == 0
+
+            # other tags, other cursor
+            source = LiveblogSource(config=dict(conf, filter_tags="foo"))
+            source.get_last_updated = asynctest.CoroutineMock(return_value=None)
+            await source._get_updated()
+            assert source.get_last_updated.call_count == 1
+        checkpoint._checkpoint_stores.clear()
+
     async def test_get_api_posts(self):
         self.client._is_source_open = asynctest.CoroutineMock(return_value=True)
         self.client._get = asynctest.CoroutineMock(return_value={})
@@ -213,6 +418,171 @@ class LiveblogSourceTests(asynctest.TestCase):
         assert self.client._get.call_count == 0
         assert self.client._is_source_open.call_count == 1
 
+    async def test_get_posts_params_projection(self):
+        self.client.last_updated = datetime(2014,10,20, 14, 48, 34)
+        source = json.loads(parse_qs(await self.client._get_posts_params())["source"][0])
+        assert "_source" not in source
+
+        self.conf.update({"projection": True})
+        client = LiveblogSource(config=self.conf)
+        client.last_updated = self.client.last_updated
+        source = json.loads(parse_qs(await client._get_posts_params())["source"][0])
+        assert source["_source"] == {"includes": list(POST_FIELDS)}
+
+        self.conf.update({"post_fields": "_id, _updated"})
+        client = LiveblogSource(config=self.conf)
+        client.last_updated = self.client.last_updated
+        source = json.loads(parse_qs(await client._get_posts_params())["source"][0])
+        assert source["_source"] == {"includes": ["_id", "_updated"]}
+
+    async def test_poll_bytes(self):
+        items = load_json('posts.json')["_items"]
+        self.client._metrics = asynctest.MagicMock()
+        self.client._is_source_open = asynctest.CoroutineMock(return_value=True)
+        self.client.last_updated = datetime(2016, 10, 20, 15, 22, 30)
+
+        async def get(url):
+            self.client.bytes_received += 1000
+            return {"_items": items[:2]}
+        self.client._get = asynctest.CoroutineMock(side_effect=get)
+        await self.client.poll()
+        assert self.client.last_poll_bytes == 1000
+        self.client._metrics.observe_poll.assert_called_once_with("https://example.com/api", 1000, 2)
+
+    async def test_get_posts_params_paging(self):
+        self.client.last_updated = datetime(2014,10,20, 14, 48, 34)
+        self.client._page_size = 50
+        p = parse_qs(await self.client._get_posts_params(3))
+        assert p["max_results"] == ["50"]
+        assert p["page"] == ["3"]
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_conf_paging(self):
+        assert self.client._page_size == 20
+        assert self.client._max_posts_per_poll == 200
+        self.conf.update({"page_size": 100, "max_posts_per_poll": 10})
+        client = LiveblogSource(config=self.conf)
+        assert client._page_size == 100
+        assert client._max_posts_per_poll == 100
+
+    def _serve_posts(self, items):
+        """Answers posts requests like the API, sorted by *_updated* and filtered by the range of the query."""
+        items = sorted(items, key=lambda i: i["_updated"])
+
+        def get(url):
+            params = parse_qs(url.split("?")[1])
+            updated = json.loads(params["source"][0])["query"]["filtered"]["filter"]["and"][0]["range"]["_updated"]
+            found = [i for i in items if i["_updated"] > updated.get("gt", "") and i["_updated"] >= updated.get("gte", "")]
+            size, page = int(params["max_results"][0]), int(params["page"][0])
+            return {"_items": found[(page - 1) * size:page * size]}
+        return get
+
+    async def test_poll_catch_up(self):
+        items = sorted(load_json('posts.json')["_items"][:12], key=lambda i: i["_updated"])
+        self.client._page_size = 5
+        self.client._is_source_open = asynctest.CoroutineMock(return_value=True)
+        self.client.last_updated = datetime(2016, 3, 1)
+        self.client._get = asynctest.CoroutineMock(side_effect=self._serve_posts(items))
+        posts = await self.client.poll()
+        assert [p.id for p in posts] == [i["_id"] for i in items]
+        # pages overlap by the post at the cursor
+        assert self.client._get.call_count == 3
+        assert self.client.last_updated == posts[-1].updated
+
+    async def test_poll_catch_up_same_updated(self):
+        items = load_json('posts.json')["_items"][:6]
+        for item in items:
+            item["_updated"] = "2016-03-29T13:42:56+00:00"
+        self.client._page_size = 2
+        self.client._is_source_open = asynctest.CoroutineMock(return_value=True)
+        self.client.last_updated = datetime(2016, 3, 1)
+        self.client._get = asynctest.CoroutineMock(side_effect=self._serve_posts(items))
+        posts = await self.client.poll()
+        assert sorted(p.id for p in posts) == sorted(i["_id"] for i in items)
+        # a page with a single timestamp is continued by number
+        pages = [parse_qs(c[0][0].split("?")[1])["page"][0] for c in self.client._get.call_args_list]
+        assert pages == ["1", "1", "2", "3", "4"]
+
+    async def test_poll_catch_up_limit(self):
+        items = load_json('posts.json')["_items"]
+        self.client._page_size = 5
+        self.client._max_posts_per_poll = 10
+        self.client._is_source_open = asynctest.CoroutineMock(return_value=True)
+        self.client.last_updated = datetime(2016, 10, 20, 15, 22, 30)
+        self.client._get = asynctest.CoroutineMock(
+            side_effect=[{"_items": items[:5]}, {"_items": items[5:10]}, {"_items": items[10:15]}])
+        posts = await self.client.poll()
+        assert len(posts) == 10
+        assert self.client._get.call_count == 2
+
+    async def test_poll_catch_up_moved_post(self):
+        items = load_json('posts.json')["_items"]
+        edited = dict(items[0], _updated="2016-03-29T13:50:00+00:00")
+        self.client._page_size = 2
+        self.client._is_source_open = asynctest.CoroutineMock(return_value=True)
+        self.client.last_updated = datetime(2016, 10, 20, 15, 22, 30)
+        self.client._get = asynctest.CoroutineMock(
+            side_effect=[{"_items": items[:2]}, {"_items": [items[2], edited]}, {"_items": []}])
+        posts = await self.client.poll()
+        assert [p.id for p in posts] == [items[1]["_id"], items[2]["_id"], items[0]["_id"]]
+        assert posts[-1].data["_updated"] == edited["_updated"]
+
+    async def test_poll_adaptive(self):
+        items = load_json('posts.json')["_items"]
+        self.conf.update({"adaptive_poll": True, "poll_backoff": 10, "max_poll_interval": 30})
+        client = LiveblogSource(config=self.conf)
+        client._is_source_open = asynctest.CoroutineMock(return_value=True)
+        client.last_updated = datetime(2016, 10, 20, 15, 22, 30)
+        client._fetch_posts = asynctest.CoroutineMock(return_value=[])
+        with asynctest.patch("livebridge_liveblog.source.time.monotonic") as monotonic:
+            monotonic.return_value = 1000
+            # idle blog backs off 10, 20, 30 and stays at the ceiling
+            for delay in [10, 20, 30, 30]:
+                assert await client.poll() == []
+                assert client._next_poll == monotonic.return_value + delay
+                calls = client._fetch_posts.call_count
+                monotonic.return_value += delay - 1
+                assert await client.poll() == []
+                assert client._fetch_posts.call_count == calls
+                monotonic.return_value += 1
+            assert client._idle_polls == 4
+
+            # failed polls don't grow the backoff, the blog is polled again on the next call
+            client._fetch_posts.return_value = None
+            assert await client.poll() == []
+            assert client._idle_polls == 4
+            assert await client.poll() == []
+            assert client._fetch_posts.call_count == 6
+            client._fetch_posts.return_value = []
+            assert await client.poll() == []
+            assert client._next_poll == monotonic.return_value + 30
+            monotonic.return_value += 30
+
+            # new posts reset the backoff, active blog is polled on every call
+            client._fetch_posts.return_value = [LiveblogPost(items[0])]
+            assert len(await client.poll()) == 1
+            assert client._idle_polls == 0
+            assert len(await client.poll()) == 1
+            assert client._fetch_posts.call_count == 9
+        await client.stop()
+
+    async def test_fetch_posts_failed(self):
+        self.client.last_updated = datetime(2016, 10, 20, 15, 22, 30)
+        self.client._get = asynctest.CoroutineMock(return_value={})
+        assert await self.client._fetch_posts() is None
+        self.client._get = asynctest.CoroutineMock(return_value={"_items": []})
+        assert await self.client._fetch_posts() == []
+        self.client._get_stream = asynctest.CoroutineMock(return_value=None)
+        assert await self.client._stream_posts_pages() is None
+
+    async def test_poll_not_adaptive(self):
+        self.client._is_source_open = asynctest.CoroutineMock(return_value=True)
+        self.client._fetch_posts = asynctest.CoroutineMock(return_value=[])
+        assert await self.client.poll() == []
+        assert await self.client.poll() == []
+        assert self.client._fetch_posts.call_count == 2
+        assert self.client._next_poll == 0
+
     async def test_get_api_posts_failing(self):
         self.client._is_source_open = asynctest.CoroutineMock(return_value=True)
         assert self.client.last_updated == None
@@ -235,6 +605,14 @@ class LiveblogSourceTests(asynctest.TestCase):
             res = await self.client._post("https://dpa.com/resource", data, 200)
             assert res == None
 
+    async def test_post_json_headers(self):
+        session = asynctest.MagicMock(close=asynctest.CoroutineMock(return_value=None))
+        session.post = asynctest.MagicMock(return_value=TestResponse(url="https://dpa.com/resource"))
+        self.client._session = session
+        await self.client._post("https://dpa.com/resource", "{}", 201, headers={"X-Foo": "baz"})
+        headers = session.post.call_args[1]["headers"]
+        assert headers == {"Content-Type": "application/json;charset=utf-8", "X-Foo": "baz"}
+
     async def test_patch(self):
         data = '{"one": 1, "two": 2}'
         with asynctest.patch("aiohttp.client.ClientSession") as patched:
@@ -270,6 +648,62 @@ class LiveblogSourceTests(asynctest.TestCase):
             res = await self.client._get("https://dpa.com/resource", status=404)
             assert res == {}
 
+    async def test_get_conditional(self):
+        stats = dict(common.conditional_get_stats)
+        first = TestResponse(url="", data=b'{"blog_status": "open"}', headers={"ETag": "abc", "Last-Modified": "Tue"})
+        first._status = 200
+        second = TestResponse(url="")
+        second._status = 304
+        session = asynctest.MagicMock(close=asynctest.CoroutineMock(return_value=None))
+        session.get = asynctest.MagicMock(side_effect=[first, second])
+        self.client._session = session
+
+        res = await self.client._get("https://dpa.com/resource")
+        assert res == {"blog_status": "open"}
+        assert session.get.call_args[1]["headers"] == {}
+        res = await self.client._get("https://dpa.com/resource")
+        assert res == {"blog_status": "open"}
+        assert session.get.call_args[1]["headers"] == {"If-None-Match": "abc", "If-Modified-Since": "Tue"}
+        assert common.conditional_get_stats["hits"] == stats.get("hits", 0) + 1
+        assert common.conditional_get_stats["misses"] == stats.get("misses", 0) + 1
+        assert common.conditional_get_stats["bytes_saved"] == stats.get("bytes_saved", 0) + 23
+
+    async def test_get_conditional_disabled(self):
+        self.client._conditional_get = False
+        resp = TestResponse(url="", headers={"ETag": "abc"})
+        resp._status = 200
+        session = asynctest.MagicMock(close=asynctest.CoroutineMock(return_value=None))
+        session.get = asynctest.MagicMock(return_value=resp)
+        self.client._session = session
+        await self.client._get("https://dpa.com/resource")
+        await self.client._get("https://dpa.com/resource")
+        assert session.get.call_args[1]["headers"] == {}
+        assert len(self.client._validators) == 0
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_store_validators(self):
+        self.client._validators.size = 2
+        self.client._store_validators("a", {"ETag": "1"}, b"{}")
+        self.client._store_validators("b", {"Last-Modified": "Tue"}, b"{}")
+        self.client._store_validators("c", {"ETag": "3"}, b"{}")
+        assert list(self.client._validators) == ["b", "c"]
+        assert self.client._get_validator_headers("b") == {"If-Modified-Since": "Tue"}
+        assert self.client._get_validator_headers("a") == {}
+        # no validators anymore
+        self.client._store_validators("c", {}, b"{}")
+        assert list(self.client._validators) == ["b"]
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_store_validators_latest_per_path(self):
+        for page in range(1, 4):
+            self.client._store_validators("https://dpa.com/posts?page={}".format(page), {"ETag": str(page)}, b"{}")
+        self.client._store_validators("https://dpa.com/blog", {"ETag": "blog"}, b"{}")
+        # only the latest posts URL keeps its response
+        assert len(self.client._validators) == 2
+        assert self.client._get_validator_headers("https://dpa.com/posts?page=1") == {}
+        assert self.client._get_validator_headers("https://dpa.com/posts?page=3") == {"If-None-Match": "3"}
+        assert self.client._get_validator_headers("https://dpa.com/blog") == {"If-None-Match": "blog"}
+
     async def test_get_catch_exception(self):
         res = await self.client._get(None)
         assert res == {}
@@ -290,8 +724,73 @@ class LiveblogSourceTests(asynctest.TestCase):
         res = await self.client._is_source_open()
         assert res == False
 
+    async def test_is_source_open_suspend(self):
+        self.client._source_check_interval = 600
+        self.client._max_source_check_interval = 2000
+        self.client._validators.set("url", {"url": "url", "content": b"{}"})
+        meta_url = self.client._source_meta_url
+        self.client._store_validators(meta_url, {"ETag": "abc"}, b'{"blog_status": "closed"}')
+        session = self.client.session
+        self.client._get = asynctest.CoroutineMock(return_value={"blog_status": "closed"})
+        assert await self.client._is_source_open() is False
+        assert session.closed is True
+        assert self.client._session is None
+        # status checks of the closed blog stay conditional
+        assert list(self.client._validators) == [meta_url]
+        assert self.client._get_validator_headers(meta_url) == {"If-None-Match": "abc"}
+
+        # one pending check, closed blog is rechecked less often
+        delays = []
+        for _ in range(3):
+            handler = self.client._source_check_handler
+            delays.append(self.client._get_source_check_delay())
+            self.client._reset_source_meta()
+            assert await self.client._is_source_open() is False
+            assert handler.cancelled()
+        assert delays == [600, 1200, 2000]
+        assert self.client._get_source_check_delay() == 2000
+        assert self.client._get.call_count == 4
+
+        # failing check keeps the status
+        self.client._reset_source_meta()
+        self.client._get = asynctest.CoroutineMock(return_value={})
+        assert await self.client._is_source_open() is False
+        assert self.client._closed_checks == 4
+
+        # reopened blog is polled right away
+        self.client._next_poll = 12345
+        self.client._get = asynctest.CoroutineMock(return_value={"blog_status": "open"})
+        assert await self.client._is_source_open() is True
+        assert self.client._closed_checks == 0
+        assert self.client._next_poll == 0
+        assert self.client._get_source_check_delay() == 600
+        assert self.client._source_meta == {"blog_status": "open"}
+
 
 def test_comma_split():
     assert comma_split("a") == ("a", )
     assert comma_split("a, b c") == ("a", "b c")
 
+
+
+def test_get_json_codec():
+    data = {"text": "<p>Über/Unter</p>", "refs": [1, None, True]}
+    for name in common.JSON_CODECS + (None, "foo"):
+        json_codec = common.get_json_codec(name)
+        encoded = json_codec.dumps(data)
+        assert type(encoded) == bytes
+        assert json.loads(encoded.decode("utf-8")) == data
+        assert json_codec.loads(encoded) == data
+    assert common.get_json_codec("foo").name == "json"
+
+
+def test_get_json_codec_fallback():
+    def missing():
+        raise ImportError()
+    common.get_json_codec.cache_clear()
+    try:
+        with asynctest.patch.dict(codec._codec_factories, {"orjson": missing, "ujson": missing}):
+            assert common.get_json_codec().name == "json"
+            assert common.get_json_codec("orjson").name == "json"
+    finally:
+        common.get_json_codec.cache_clear()
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+from livebridge_liveblog.stream import JSONItemStream
+from tests import load_json
+
+
+def _stream(data, size):
+    items = []
+    stream = JSONItemStream("_items", items.append)
+    for pos in range(0, len(data), size):
+        stream.feed(data[pos:pos + size])
+    stream.close()
+    return items, stream.meta
+
+
+def test_stream_items():
+    doc = load_json("posts.json")
+    doc["_meta"] = {"page": 1, "total": 12345}
+    for data in [json.dumps(doc).encode("utf-8"), json.dumps(doc, indent=2, ensure_ascii=False).encode("utf-8")]:
+        # chunks split multi-byte characters and numbers
+        for size in [1, 7, 1024, len(data)]:
+            items, meta = _stream(data, size)
+            assert items == doc["_items"]
+            assert meta == {k: v for k, v in doc.items() if k != "_items"}
+
+
+def test_stream_empty():
+    assert _stream(b'{"_items": [], "_meta": {}}', 3) == ([], {"_meta": {}})
+    assert _stream(b' { } ', 1) == ([], {})
+
+
+def test_stream_items_passed_early():
+    items = []
+    stream = JSONItemStream("_items", items.append)
+    stream.feed(b'{"_items": [{"_id": 1}, {"_id": 2}, {"_i')
+    assert items == [{"_id": 1}, {"_id": 2}]
+    assert stream.count == 2
+
+
+def test_stream_invalid():
+    for data in [b'{"_items": [{"_id": 1}', b'[1, 2]', b'{"_items": {}}']:
+        stream = JSONItemStream("_items", lambda item: None)
+        try:
+            stream.feed(data)
+            stream.close()
+            assert False, data
+        except ValueError:
+            pass
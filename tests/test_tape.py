@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2020 dpa-infocom GmbH
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asynctest
+import json
+import os.path
+import tempfile
+import time
+from datetime import datetime, timedelta
+from livebridge_liveblog import LiveblogSource, LiveblogTarget
+from livebridge_liveblog import breaker, tape
+from livebridge_liveblog.tape import TapePlayer, TapeRecorder, get_tape
+from benchmarks.fake_liveblog import FakeLiveblog
+
+
+class TapeTests(asynctest.TestCase):
+
+    async def setUp(self):
+        tape._tapes.clear()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.start = datetime.utcnow().replace(microsecond=0) - timedelta(minutes=10)
+
+    async def tearDown(self):
+        for item in tape._tapes.values():
+            if item.mode == "record":
+                item.close()
+        tape._tapes.clear()
+        breaker._breakers.clear()
+        self.tmp_dir.cleanup()
+
+    def _clients(self, endpoint, **config):
+        source = LiveblogSource(config=dict(config, endpoint=endpoint, source_id="blog-1", page_size=2))
+        source.get_last_updated = asynctest.CoroutineMock(return_value=self.start - timedelta(seconds=1))
+        target = LiveblogTarget(config=dict(config, endpoint=endpoint, target_id="blog-2",
+                                            auth={"user": "foo", "password": "bla"}))
+        return source, target
+
+    async def _run(self, source, target):
+        posts = await source.poll()
+        for post in posts:
+            post.content = [{"item_type": "text", "text": post.id}]
+            post.target_doc = await target.post_item(post)
+        await source.stop()
+        await target.stop()
+        return posts
+
+    async def _record_and_replay(self, path):
+        fake = FakeLiveblog()
+        endpoint = await fake.start()
+        fake.add_posts("blog-1", 3, start=self.start)
+        try:
+            clients = self._clients(endpoint, tape_path=path, tape_mode="record")
+            recorder = get_tape(path, "record")
+            assert recorder.clients == 2
+            recorded = await self._run(*clients)
+        finally:
+            await fake.stop()
+        assert recorder.entries == sum(fake.requests.values())
+        # closed by the last stopped client
+        assert recorder._file.closed
+        assert path not in tape._tapes
+
+        # fake server is gone, responses come from the tape
+        clients = self._clients(endpoint, tape_path=path, tape_mode="replay", tape_speed=0)
+        player = get_tape(path, "replay")
+        replayed = await self._run(*clients)
+        assert player.missing == 0
+        assert len(player) == 0
+        assert [p.data for p in replayed] == [p.data for p in recorded]
+        assert [p.target_doc.data for p in replayed] == [p.target_doc.data for p in recorded]
+
+    async def test_record_replay(self):
+        path = os.path.join(self.tmp_dir.name, "tape.jsonl")
+        await self._record_and_replay(path)
+        with open(path) as f:
+            entries = [json.loads(line) for line in f]
+        assert entries[0]["path"].startswith("/client_blogs/blog-1")
+        login = next(e for e in entries if e["path"] == "/auth")
+        assert login["method"] == "post"
+        # no credentials or session tokens on the tape
+        assert "request_body" not in login
+        assert json.loads(login["body"]) == {"token": "redacted"}
+
+    async def test_record_replay_compressed(self):
+        await self._record_and_replay(os.path.join(self.tmp_dir.name, "tape.jsonl.gz"))
+
+    async def test_replay_speed(self):
+        path = os.path.join(self.tmp_dir.name, "tape.jsonl")
+        with open(path, "w") as f:
+            for num, t in enumerate([10, 10.2, 10.4]):
+                f.write(json.dumps({"t": t, "duration": 0, "method": "get", "path": "/client_blogs/1",
+                                    "status": 200, "headers": {"ETag": str(num)}, "body": "{}"}) + "\n")
+        player = TapePlayer(path, speed=4)
+        start = time.monotonic()
+        for num in range(3):
+            status, headers, content = await player.play("https://example.com/api", "get",
+                                                         "https://example.com/api/client_blogs/1")
+            assert (status, headers, content) == (200, {"ETag": str(num)}, b"{}")
+        # 0.4 seconds recorded, replayed 4 times faster
+        assert 0.09 <= time.monotonic() - start < 0.2
+
+        # other blog, same operation, but nothing left
+        assert await player.play("", "get", "/client_blogs/2") == (404, {}, b"")
+        assert player.missing == 1
+
+    async def test_replay_by_operation(self):
+        path = os.path.join(self.tmp_dir.name, "tape.jsonl")
+        recorder = TapeRecorder(path)
+        recorder.record("https://example.com/api", "get", "https://example.com/api/client_blogs/1/posts?page=1",
+                        200, {"ETag": "a", "Server": "foo"}, b'{"_items": []}', duration=0.1)
+        recorder.record("https://example.com/api", "post", "https://example.com/api/archive",
+                        201, {}, b"\xff\xd8", duration=0.1, body=b"\xff")
+        recorder.close()
+        player = TapePlayer(path, speed=0)
+        assert len(player) == 2
+        assert await player.play("https://example.com/api", "get",
+                                 "https://example.com/api/client_blogs/1/posts?page=2") == \
+            (200, {"ETag": "a"}, b'{"_items": []}')
+        assert await player.play("", "post", "/archive") == (201, {}, b"\xff\xd8")
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_release_tape(self):
+        path = os.path.join(self.tmp_dir.name, "tape.jsonl")
+        recorder = tape.acquire_tape(path, "record")
+        assert tape.acquire_tape(path, "record") is recorder
+        tape.release_tape(recorder)
+        assert not recorder._file.closed
+        tape.release_tape(recorder)
+        assert recorder._file.closed
+        assert path not in tape._tapes
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_get_tape_invalid_mode(self):
+        with self.assertRaises(ValueError):
+            get_tape("foo", "rewind")
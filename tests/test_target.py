@@ -13,10 +13,14 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import asyncio
 import asynctest
+import json
 from collections import UserDict
 from livebridge_liveblog import LiveblogTarget
+from livebridge_liveblog import breaker, cache
 from livebridge_liveblog.common import LiveblogClient
+from livebridge_liveblog.target import ITEMS_KEY
 from livebridge.base import BaseTarget, TargetResponse, InvalidTargetResource
 from tests import load_json
 from .test_source import TestResponse
@@ -24,6 +28,8 @@ from .test_source import TestResponse
 class LiveblogTargetTests(asynctest.TestCase):
 
     def setUp(self):
+        cache._image_caches.clear()
+        breaker._breakers.clear()
         self.conf = {
             "auth": {
                 "user": "foo",
@@ -35,6 +41,9 @@ class LiveblogTargetTests(asynctest.TestCase):
         }
         self.target = LiveblogTarget(config=self.conf)
 
+    async def tearDown(self):
+        await self.target.stop()
+
     @asynctest.fail_on(unused_loop=False)
     def test_init(self):
         assert self.target.target_id == self.conf["target_id"]
@@ -132,8 +141,41 @@ class LiveblogTargetTests(asynctest.TestCase):
         assert self.target._build_image_item.call_count == 1
         assert self.target._post.call_count == 1
 
+    @asynctest.fail_on(unused_loop=False)
+    def test_conf_item_concurrency(self):
+        assert self.target._item_concurrency == 4
+        self.conf["item_concurrency"] = 0
+        target = LiveblogTarget(config=self.conf)
+        assert target._item_concurrency == 1
+
+    async def test_save_items_keeps_order(self):
+        self.target._item_concurrency = 2
+        running = []
+        max_running = []
+
+        async def save_item(item):
+            running.append(item)
+            max_running.append(len(running))
+            # later items finish first
+            await asyncio.sleep(0.01 * (5 - item))
+            running.remove(item)
+            return {"guid": "urn-{}".format(item)}
+
+        self.target._save_item = save_item
+        items = await self.target._save_items([1, 2, 3, 4])
+        assert [i["guid"] for i in items] == ["urn-1", "urn-2", "urn-3", "urn-4"]
+        assert max(max_running) == 2
+
+    async def test_save_items_failing(self):
+        self.target._save_item = asynctest.CoroutineMock(
+            side_effect=[{"guid": "urn-1"}, None, AttributeError("foo")])
+        with self.assertRaises(Exception) as ctx:
+            await self.target._save_items([1, 2, 3])
+        assert str(ctx.exception).startswith("2 of 3 items") == True
+
     async def test_save_image(self):
         self.target.session_token = "foo"
+        self.target._image_cache = None
         img_item = {"item_type": "image", "tmp_path": "tests/test.jpg"}
         resp = TestResponse(url="http://example.com")
         with asynctest.patch("aiohttp.client.ClientSession.post") as patched:
@@ -147,27 +189,80 @@ class LiveblogTargetTests(asynctest.TestCase):
             res = await self.target._save_image(img_item)
             assert res == None
 
+    async def test_save_image_reuses_session(self):
+        self.target.session_token = "foo"
+        self.target._image_cache = None
+        self.target.verify_ssl = False
+        img_item = {"item_type": "image", "tmp_path": "tests/test.jpg"}
+        with asynctest.patch("aiohttp.client.ClientSession.post") as patched:
+            patched.return_value = TestResponse(url="http://example.com")
+            await self.target._save_image(img_item)
+            session = self.target._session
+            await self.target._save_image(img_item)
+            assert patched.call_count == 2
+            assert self.target._session is session
+            assert patched.call_args[1]["headers"] == self.target._get_auth_header()
+            assert session.connector._ssl is False
+
+    async def test_save_image_cached(self):
+        self.target.session_token = "foo"
+        img_item = {"item_type": "image", "tmp_path": "tests/test.jpg"}
+        with asynctest.patch("aiohttp.client.ClientSession.post") as patched:
+            patched.return_value = TestResponse(url="http://example.com", data=b'{"_id": "img-1"}')
+            res = await self.target._save_image(img_item)
+            assert res == {"_id": "img-1"}
+            # same image again, e.g. in another blog at the same instance
+            other = LiveblogTarget(config=dict(self.conf, target_id=54321))
+            res = await other._save_image(img_item)
+            assert res == {"_id": "img-1"}
+            assert patched.call_count == 1
+            await other.stop()
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_conf_image_cache(self):
+        assert self.target._image_cache is cache.get_image_cache(self.conf["endpoint"])
+        self.conf["image_cache_size"] = 0
+        assert LiveblogTarget(config=self.conf)._image_cache == None
+
+    async def test_save_image_missing_file(self):
+        self.target.session_token = "foo"
+        with asynctest.patch("aiohttp.client.ClientSession.post") as patched:
+            res = await self.target._save_image({"item_type": "image", "tmp_path": "/not/existing.jpg"})
+            assert res == None
+            assert patched.call_count == 0
+
     async def test_post_item(self):
         self.target._login = asynctest.CoroutineMock(return_value=True)
-        self.target._save_item = asynctest.CoroutineMock(return_value={"one": "two"})
+        self.target._save_item = asynctest.CoroutineMock(return_value={"guid": "urn-1"})
         self.target._build_post_data = asynctest.Mock(return_value='{"foo": "baz"}')
         self.target._post = asynctest.CoroutineMock(return_value={"res": "true"})
-        res = await self.target.post_item(asynctest.Mock(content=[1,2,3]))
+        res = await self.target.post_item(asynctest.Mock(content=[{"text": "a"}, {"text": "b"}, {"text": "c"}]))
         assert type(res) == TargetResponse
-        assert res.data == {"res": "true"}
+        assert res["res"] == "true"
+        assert [i["guid"] for i in res[ITEMS_KEY]] == ["urn-1"] * 3
         assert self.target._login.call_count == 1
         assert self.target._build_post_data.call_count == 1
         assert self.target._save_item.call_count == 3
         assert self.target._post.call_count == 1
 
+    async def test_post_item_failing_item(self):
+        self.target._login = asynctest.CoroutineMock(return_value=True)
+        self.target._save_item = asynctest.CoroutineMock(side_effect=[{"guid": "urn-1"}, None])
+        self.target._post = asynctest.CoroutineMock(return_value={"res": "true"})
+        with self.assertRaises(Exception):
+            await self.target.post_item(asynctest.Mock(content=[{"text": "a"}, {"text": "b"}]))
+        assert self.target._post.call_count == 0
+
     async def test_update_item(self):
         self.target._login = asynctest.CoroutineMock(return_value=True)
-        self.target._save_item = asynctest.CoroutineMock(return_value={"one": "two"})
+        self.target._save_item = asynctest.CoroutineMock(return_value={"guid": "urn-1"})
         self.target._build_post_data = asynctest.Mock(return_value='{"foo": "baz"}')
         self.target._patch = asynctest.CoroutineMock(return_value={"res": "true"})
-        res = await self.target.update_item(asynctest.Mock(content=[1,2,3]))
+        res = await self.target.update_item(
+            asynctest.Mock(content=[{"text": "a"}, {"text": "b"}, {"text": "c"}], target_doc={"_id": "foo"}))
         assert type(res) == TargetResponse
-        assert res.data == {"res": "true"}
+        assert res["res"] == "true"
+        assert [i["guid"] for i in res[ITEMS_KEY]] == ["urn-1"] * 3
         assert self.target._login.call_count == 1
         assert self.target._build_post_data.call_count == 1
         assert self.target._save_item.call_count == 3
@@ -178,6 +273,170 @@ class LiveblogTargetTests(asynctest.TestCase):
         with self.assertRaises(InvalidTargetResource):
             await self.target.update_item(asynctest.Mock(content=[1,2,3]))
 
+    async def test_login_cached_between_operations(self):
+        self.target._post = asynctest.CoroutineMock(return_value={"token": "foo"})
+        self.target._patch = asynctest.CoroutineMock(return_value={"res": "true"})
+        post = asynctest.Mock(target_doc={"_id": "foo", "_etag": "bar"})
+        await self.target.delete_item(post)
+        await self.target.delete_item(post)
+        assert self.target._post.call_count == 1
+        assert self.target._patch.call_count == 2
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_get_item_hash(self):
+        item = {"item_type": "image", "text": "foo", "meta": {"caption": "bar"}, "tmp_path": "/tmp/1.jpg"}
+        item_hash = self.target._get_item_hash(item)
+        assert item_hash == self.target._get_item_hash(dict(item, tmp_path="/tmp/2.jpg", blog=1))
+        assert item_hash != self.target._get_item_hash(dict(item, text="baz"))
+
+    @asynctest.fail_on(unused_loop=False)
+    def test_get_known_items(self):
+        post = asynctest.Mock(target_doc=None)
+        assert self.target._get_known_items(post) == {}
+        post.target_doc = {ITEMS_KEY: [{"hash": "a", "guid": "urn-1"}, {"hash": "a", "guid": "urn-2"},
+                                       {"hash": "b", "guid": "urn-3"}]}
+        assert self.target._get_known_items(post) == {"a": ["urn-1", "urn-2"], "b": ["urn-3"]}
+
+    async def test_update_item_reuses_items(self):
+        self.target.session_token = "foo"
+        self.target._token_expires = float("inf")
+        content = [{"item_type": "text", "text": "one"}, {"item_type": "text", "text": "two"},
+                   {"item_type": "text", "text": "one"}]
+        self.target._save_item = asynctest.CoroutineMock(
+            side_effect=[{"guid": "urn-1"}, {"guid": "urn-2"}, {"guid": "urn-4"}])
+        self.target._post = asynctest.CoroutineMock(return_value={"_id": "post-1", "_etag": "etag-1"})
+        created = await self.target.post_item(asynctest.Mock(content=content, is_sticky=False, is_highlighted=False))
+        assert self.target._save_item.call_count == 3
+
+        # typo fix in one item, the others are reused
+        content = [{"item_type": "text", "text": "one"}, {"item_type": "text", "text": "two, fixed"},
+                   {"item_type": "text", "text": "one"}]
+        self.target._save_item = asynctest.CoroutineMock(return_value={"guid": "urn-3"})
+        self.target._patch = asynctest.CoroutineMock(return_value={"_id": "post-1", "_etag": "etag-2"})
+        post = asynctest.Mock(content=content, target_doc=created, is_sticky=False, is_highlighted=False)
+        res = await self.target.update_item(post)
+        assert self.target._save_item.call_count == 1
+        assert self.target._save_item.call_args[0][0]["text"] == "two, fixed"
+        patched = json.loads(self.target._patch.call_args[0][1])
+        assert patched["groups"][1]["refs"] == [{"residRef": "urn-1"}, {"residRef": "urn-3"}, {"residRef": "urn-4"}]
+        assert [i["guid"] for i in res[ITEMS_KEY]] == ["urn-1", "urn-3", "urn-4"]
+        assert self.target._patch.call_args[1]["etag"] == "etag-1"
+
+    async def test_update_item_coalesced(self):
+        target = LiveblogTarget(config=dict(self.conf, update_window=0.1, max_update_delay=0.15))
+        target.session_token = "foo"
+        target._token_expires = float("inf")
+        target._save_item = asynctest.CoroutineMock(side_effect=lambda item: {"guid": "urn-" + item["text"]})
+        etags = iter(["etag-{}".format(num) for num in range(2, 10)])
+        target._patch = asynctest.CoroutineMock(side_effect=lambda *args, **kwargs: {"_id": "post-1", "_etag": next(etags)})
+        target._db.update_post = asynctest.CoroutineMock()
+
+        def make_post(text):
+            return asynctest.Mock(content=[{"item_type": "text", "text": text}], is_sticky=False, is_highlighted=False,
+                                  target_doc={"_id": "post-1", "_etag": "etag-1"})
+
+        # first update is sent right away
+        res = await target.update_item(make_post("a"))
+        assert res["_etag"] == "etag-2"
+        assert target._patch.call_count == 1
+
+        # following ones within the window are held back, their items are saved
+        res = await target.update_item(make_post("b"))
+        assert res["_etag"] == "etag-2"
+        assert [i["guid"] for i in res[ITEMS_KEY]] == ["urn-b"]
+        await asyncio.sleep(0.06)
+        res = await target.update_item(make_post("c"))
+        assert res["_etag"] == "etag-2"
+        assert target._save_item.call_count == 3
+        assert target._patch.call_count == 1
+
+        # only the latest is sent, at most max_update_delay after the first held back one
+        await asyncio.sleep(0.06)
+        assert target._patch.call_count == 1
+        await asyncio.sleep(0.08)
+        assert target._patch.call_count == 2
+        patched = json.loads(target._patch.call_args[0][1])
+        assert patched["groups"][1]["refs"] == [{"residRef": "urn-c"}]
+        assert target._patch.call_args[1]["etag"] == "etag-2"
+        assert target._db.update_post.call_count == 1
+        assert target._db.update_post.call_args[1]["target_doc"]["_etag"] == "etag-3"
+
+        # held back update is sent on stop
+        await asyncio.sleep(0.12)
+        await target.update_item(make_post("d"))
+        await target.update_item(make_post("e"))
+        assert target._patch.call_count == 3
+        assert target._patch.call_args[1]["etag"] == "etag-3"
+        await target.stop()
+        assert target._patch.call_count == 4
+        assert target._patch.call_args[1]["etag"] == "etag-4"
+
+    async def test_update_item_coalesced_retry(self):
+        target = LiveblogTarget(config=dict(self.conf, update_window=0.05, max_update_delay=0.05, retry_backoff=0.01))
+        target.session_token = "foo"
+        target._token_expires = float("inf")
+        target._save_item = asynctest.CoroutineMock(side_effect=lambda item: {"guid": "urn-" + item["text"]})
+        target._patch = asynctest.CoroutineMock(side_effect=[
+            {"_id": "post-1", "_etag": "etag-2"}, None, Exception("timeout"), {"_id": "post-1", "_etag": "etag-3"}])
+        target._db.update_post = asynctest.CoroutineMock()
+        post = asynctest.Mock(content=[{"item_type": "text", "text": "a"}], is_sticky=False, is_highlighted=False,
+                              target_doc={"_id": "post-1", "_etag": "etag-1"})
+        await target.update_item(post)
+        post.content = [{"item_type": "text", "text": "b"}]
+        await target.update_item(post)
+
+        # failed flushes are retried, until the update is sent
+        for _ in range(20):
+            await asyncio.sleep(0.05)
+            if target._patch.call_count == 4:
+                break
+        assert target._patch.call_count == 4
+        patched = json.loads(target._patch.call_args[0][1])
+        assert patched["groups"][1]["refs"] == [{"residRef": "urn-b"}]
+        assert target._patch.call_args[1]["etag"] == "etag-2"
+        assert target._db.update_post.call_count == 1
+        assert target._db.update_post.call_args[1]["target_doc"]["_etag"] == "etag-3"
+        await target.stop()
+
+    async def test_update_item_coalesced_rejected(self):
+        target = LiveblogTarget(config=dict(self.conf, update_window=10))
+        target.session_token = "foo"
+        target._token_expires = float("inf")
+        target._save_item = asynctest.CoroutineMock(side_effect=lambda item: {"guid": "urn-" + item["text"]})
+        target._patch = asynctest.CoroutineMock(side_effect=[
+            {"_id": "post-1", "_etag": "etag-2"}, InvalidTargetResource("edited")])
+        target._db.update_post = asynctest.CoroutineMock()
+        post = asynctest.Mock(content=[{"item_type": "text", "text": "a"}], is_sticky=False, is_highlighted=False,
+                              target_doc={"_id": "post-1", "_etag": "etag-1"})
+        await target.update_item(post)
+        post.content = [{"item_type": "text", "text": "b"}]
+        res = await target.update_item(post)
+        assert [i["guid"] for i in res[ITEMS_KEY]] == ["urn-b"]
+
+        # not retried, the stored doc is reset to the last confirmed one
+        await target.stop()
+        assert target._patch.call_count == 2
+        stored = target._db.update_post.call_args[1]["target_doc"]
+        assert stored["_etag"] == "etag-2"
+        assert [i["guid"] for i in stored[ITEMS_KEY]] == ["urn-a"]
+
+    async def test_delete_item_drops_held_back_update(self):
+        target = LiveblogTarget(config=dict(self.conf, update_window=10))
+        target.session_token = "foo"
+        target._token_expires = float("inf")
+        target._save_item = asynctest.CoroutineMock(return_value={"guid": "urn-1"})
+        target._patch = asynctest.CoroutineMock(side_effect=[{"_id": "post-1", "_etag": "etag-2"}, {}, {}])
+        post = asynctest.Mock(content=[{"item_type": "text", "text": "a"}], is_sticky=False, is_highlighted=False,
+                              target_doc={"_id": "post-1", "_etag": "etag-1"})
+        await target.update_item(post)
+        await target.update_item(post)
+        assert target._patch.call_count == 1
+        await target.delete_item(asynctest.Mock(target_doc={"_id": "post-1", "_etag": "etag-1"}))
+        assert target._patch.call_count == 2
+        assert target._patch.call_args[1]["etag"] == "etag-2"
+        await target.stop()
+        assert target._patch.call_count == 2
+
     async def test_delete_item(self):
         self.target._login = asynctest.CoroutineMock(return_value=True)
         self.target._patch = asynctest.CoroutineMock(return_value={"res": "true"})